@@ -1,6 +1,7 @@
 import pyupbit
 import pandas as pd
 import numpy as np
+from collections import deque
 
 def calculate_indicators(df):
     """
@@ -50,6 +51,255 @@ def calculate_indicators(df):
     # 지표 계산으로 인한 결측치(NaN) 제거
     return df.dropna()
 
+# ==========================================
+# [NEW] 증분(스트리밍) 지표 엔진
+# ==========================================
+INDICATOR_COLUMNS = [
+    'open', 'high', 'low', 'close', 'volume',
+    'MA5', 'MA20', 'EMA50', 'EMA200', 'RSI', 'MACD', 'MACD_Signal',
+    'BB_Mid', 'BB_Up', 'BB_Low', 'TR', 'ATR', 'vol_avg', 'vol_ratio'
+]
+
+def _ema_alpha(span):
+    return 2 / (span + 1)
+
+class IndicatorState:
+    """
+    캔들 1개씩 받아 calculate_indicators와 같은 값을 O(1)로 갱신하는 상태 엔진
+    - 같은 타임스탬프의 캔들이 다시 들어오면(진행 중 캔들) 직전 상태로 되돌린 뒤 재계산
+    - 롤링 윈도우 크기가 고정(최대 20)이라 캔들 수와 무관하게 갱신 비용이 일정함
+    """
+    RSI_ALPHA = 1 / 14  # ewm(com=13)
+
+    def __init__(self, maxlen=200):
+        self.history = deque(maxlen=maxlen)  # (timestamp_ms, row dict) - 지표 완성된 캔들만
+        self.last_ts = None
+        self._prev = None  # 마지막 캔들 적용 직전 상태 (갱신용)
+        self._state = {
+            'count': 0,
+            'closes': deque(maxlen=20),
+            'volumes': deque(maxlen=20),
+            'trs': deque(maxlen=14),
+            'prev_close': None,
+            'ema50': None, 'ema200': None,
+            'ema12': None, 'ema26': None, 'signal': None,
+            'up_num': 0.0, 'down_num': 0.0, 'rsi_den': 0.0,
+        }
+
+    @classmethod
+    def from_ohlcv(cls, ohlcv, maxlen=200):
+        """ccxt fetch_ohlcv 결과로 초기 상태 구성"""
+        state = cls(maxlen=maxlen)
+        for candle in ohlcv:
+            state.update(candle)
+        return state
+
+    @staticmethod
+    def _copy_state(s):
+        c = dict(s)
+        c['closes'] = deque(s['closes'], maxlen=20)
+        c['volumes'] = deque(s['volumes'], maxlen=20)
+        c['trs'] = deque(s['trs'], maxlen=14)
+        return c
+
+    @staticmethod
+    def _ema(prev, value, span):
+        if prev is None: return value
+        a = _ema_alpha(span)
+        return a * value + (1 - a) * prev
+
+    def update(self, candle):
+        """
+        candle: [timestamp_ms, open, high, low, close, volume] (ccxt 형식)
+        반환: 지표가 모두 채워진 경우 row dict, 워밍업 중(NaN 존재)이면 None
+        """
+        ts = int(candle[0])
+        o, h, l, c, v = (float(x) for x in candle[1:6])
+
+        if self.last_ts is not None and ts < self.last_ts:
+            return None  # 과거 캔들은 무시
+        replace = self.last_ts is not None and ts == self.last_ts
+        if replace:
+            # 진행 중 캔들 갱신: 직전 상태로 롤백
+            self._state = self._copy_state(self._prev)
+            if self.history and self.history[-1][0] == ts:
+                self.history.pop()
+
+        self._prev = self._copy_state(self._state)
+        s = self._state
+        s['count'] += 1
+
+        # 1. 이동평균선
+        s['closes'].append(c)
+        closes = s['closes']
+        ma5 = sum(list(closes)[-5:]) / 5 if len(closes) >= 5 else np.nan
+        ma20 = sum(closes) / 20 if len(closes) == 20 else np.nan
+        s['ema50'] = self._ema(s['ema50'], c, 50)
+        s['ema200'] = self._ema(s['ema200'], c, 200)
+
+        # 2. RSI (adjust=True EWM을 분자/분모 누적으로 계산)
+        prev_close = s['prev_close']
+        rsi = np.nan
+        if prev_close is not None:
+            delta = c - prev_close
+            decay = 1 - self.RSI_ALPHA
+            s['up_num'] = max(delta, 0.0) + decay * s['up_num']
+            s['down_num'] = max(-delta, 0.0) + decay * s['down_num']
+            s['rsi_den'] = 1.0 + decay * s['rsi_den']
+            up = s['up_num'] / s['rsi_den']
+            down = s['down_num'] / s['rsi_den']
+            if down > 0:
+                rsi = 100 - (100 / (1 + up / down))
+            elif up > 0:
+                rsi = 100.0
+
+        # 3. MACD
+        s['ema12'] = self._ema(s['ema12'], c, 12)
+        s['ema26'] = self._ema(s['ema26'], c, 26)
+        macd = s['ema12'] - s['ema26']
+        s['signal'] = self._ema(s['signal'], macd, 9)
+
+        # 4. 볼린저 밴드 (표본 표준편차, ddof=1)
+        if len(closes) == 20:
+            std = float(np.std(closes, ddof=1))
+            bb_up, bb_low = ma20 + std * 2, ma20 - std * 2
+        else:
+            bb_up = bb_low = np.nan
+
+        # 5. ATR
+        if prev_close is None:
+            tr = h - l
+        else:
+            tr = max(h - l, abs(h - prev_close), abs(l - prev_close))
+        s['trs'].append(tr)
+        atr = sum(s['trs']) / 14 if len(s['trs']) == 14 else np.nan
+
+        # 6. 거래량 비율
+        s['volumes'].append(v)
+        if len(s['volumes']) == 20:
+            vol_avg = sum(s['volumes']) / 20
+            if vol_avg != 0: vol_ratio = v / vol_avg
+            else: vol_ratio = np.inf if v > 0 else np.nan
+        else:
+            vol_avg = vol_ratio = np.nan
+
+        s['prev_close'] = c
+        self.last_ts = ts
+
+        row = {
+            'open': o, 'high': h, 'low': l, 'close': c, 'volume': v,
+            'MA5': ma5, 'MA20': ma20, 'EMA50': s['ema50'], 'EMA200': s['ema200'],
+            'RSI': rsi, 'MACD': macd, 'MACD_Signal': s['signal'],
+            'BB_Mid': ma20, 'BB_Up': bb_up, 'BB_Low': bb_low,
+            'TR': tr, 'ATR': atr, 'vol_avg': vol_avg, 'vol_ratio': vol_ratio
+        }
+        # calculate_indicators의 dropna()와 동일하게 NaN이 있으면 미완성 처리
+        if any(isinstance(val, float) and np.isnan(val) for val in row.values()):
+            return None
+        self.history.append((ts, row))
+        return row
+
+    def to_frame(self):
+        """누적된 지표 이력을 calculate_indicators 결과와 같은 형태의 DataFrame으로 반환"""
+        if not self.history:
+            return pd.DataFrame(columns=INDICATOR_COLUMNS)
+        index = pd.to_datetime([ts for ts, _ in self.history], unit='ms')
+        df = pd.DataFrame([row for _, row in self.history], index=index, columns=INDICATOR_COLUMNS)
+        df.index.name = 'datetime'
+        return df
+
+# ==========================================
+# [NEW] 창(window) 단위 지표 엔진 (긴 백테스트 메모리 절약용)
+# ==========================================
+# 프롬프트/정산에 실제로 쓰는 지표만 남김 (MA5, MA20, BB_Mid, TR, vol_avg 같은 중간값 제외)
+COMPACT_COLUMNS = ['EMA50', 'EMA200', 'RSI', 'MACD', 'MACD_Signal', 'BB_Up', 'BB_Low', 'ATR', 'vol_ratio']
+
+class ChunkedIndicators:
+    """
+    긴 캔들 구간을 창 단위로 받아 calculate_indicators와 같은 값을 벡터 연산으로 계산
+    - 롤링 지표용 꼬리 캔들(20개)과 EMA/RSI 누적값을 다음 창으로 넘김 -> 메모리는 창 크기에만 비례
+    - 가격(open/high/low/close)은 float64 유지 (SL/TP 비교 정확도), 거래량/지표는 dtype(기본 float32)
+    - 워밍업(NaN) 캔들은 calculate_indicators의 dropna()와 동일하게 제외
+    """
+    TAIL = 20  # 가장 긴 롤링 윈도우(20) + TR의 직전 종가
+
+    def __init__(self, dtype=np.float32):
+        self.dtype = dtype
+        self.tail = np.empty((0, 6), dtype=np.float64)
+        self.ema = {}  # span별 마지막 EMA 값 ('signal' = MACD Signal)
+        self.rsi_num = None  # RSI 상승/하락폭 EWM 분자 누적값 (분모는 약분되어 필요 없음)
+
+    @staticmethod
+    def _ema(values, span, seed):
+        """ewm(span, adjust=False)를 seed(직전 창 마지막 값)에서 이어서 계산"""
+        if seed is None:
+            return pd.Series(values).ewm(span=span, adjust=False).mean().to_numpy()
+        return pd.Series(np.concatenate(([seed], values))).ewm(span=span, adjust=False).mean().to_numpy()[1:]
+
+    def update(self, ohlcv):
+        """
+        ohlcv: (N, 6) 배열 [timestamp_ms, open, high, low, close, volume] (직전 창 바로 다음 캔들부터)
+        반환: 지표가 완성된 캔들만 담은 DataFrame (index = datetime, 컬럼 = 가격/거래량 + COMPACT_COLUMNS)
+        """
+        new = np.asarray(ohlcv, dtype=np.float64).reshape(-1, 6)
+        data = np.concatenate((self.tail, new))
+        k = len(self.tail)  # data에서 새 캔들이 시작하는 위치
+        close = pd.Series(data[:, 4])
+        new_close = data[k:, 4]
+
+        # 1. 롤링 지표 (꼬리 캔들 덕분에 새 캔들 구간은 전체 계산과 동일)
+        ma20 = close.rolling(20).mean().to_numpy()[k:]
+        std = close.rolling(20).std().to_numpy()[k:]
+        prev_close = close.shift(1)
+        high, low = pd.Series(data[:, 2]), pd.Series(data[:, 3])
+        tr = pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1).max(axis=1)
+        atr = tr.rolling(window=14).mean().to_numpy()[k:]
+        vol_avg = pd.Series(data[:, 5]).rolling(window=20).mean().to_numpy()[k:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vol_ratio = data[k:, 5] / vol_avg
+
+        # 2. EMA / MACD (직전 창 마지막 값에서 이어서)
+        ema = {span: self._ema(new_close, span, self.ema.get(span)) for span in (12, 26, 50, 200)}
+        macd = ema[12] - ema[26]
+        signal = self._ema(macd, 9, self.ema.get('signal'))
+
+        # 3. RSI: ewm(com=13) 분자 누적 num_t = x_t + (1-a) * num_(t-1) -> a * num은 adjust=False EWM
+        alpha = 1 / 14
+        delta = np.diff(data[:, 4])[max(k - 1, 0):]  # 새 캔들별 직전 대비 변화 (전체 첫 캔들은 없음)
+        if self.rsi_num is None:
+            up_seed = down_seed = 0.0
+        else:
+            up_seed, down_seed = self.rsi_num
+        up_num = pd.Series(np.concatenate(([up_seed * alpha], np.clip(delta, 0, None)))).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:] / alpha
+        down_num = pd.Series(np.concatenate(([down_seed * alpha], np.clip(-delta, 0, None)))).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:] / alpha
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100 - (100 / (1 + up_num / down_num))
+        if len(delta) < len(new):
+            rsi = np.concatenate(([np.nan], rsi))  # 전체 첫 캔들: calculate_indicators와 동일하게 NaN
+
+        # 4. 다음 창으로 넘길 상태
+        if len(new) > 0:
+            self.ema = {span: values[-1] for span, values in ema.items()}
+            self.ema['signal'] = signal[-1]
+            if len(delta) > 0:
+                self.rsi_num = (up_num[-1], down_num[-1])
+            self.tail = data[-self.TAIL:].copy()
+
+        columns = {
+            'open': data[k:, 1], 'high': data[k:, 2], 'low': data[k:, 3], 'close': new_close,
+            'volume': data[k:, 5].astype(self.dtype),
+            'EMA50': ema[50], 'EMA200': ema[200], 'RSI': rsi, 'MACD': macd, 'MACD_Signal': signal,
+            'BB_Up': ma20 + std * 2, 'BB_Low': ma20 - std * 2, 'ATR': atr, 'vol_ratio': vol_ratio
+        }
+        valid = ~np.isnan(np.column_stack([columns[c] for c in COMPACT_COLUMNS])).any(axis=1)
+        index = pd.to_datetime(data[k:, 0][valid].astype('int64'), unit='ms')
+        df = pd.DataFrame({
+            name: (values[valid] if name in ('open', 'high', 'low', 'close', 'volume') else values[valid].astype(self.dtype))
+            for name, values in columns.items()
+        }, index=index)
+        df.index.name = 'datetime'
+        return df
+
 def get_ohlcv_data(ticker="KRW-BTC", interval="minute5", count=200):
     """캔들 데이터 조회 (구형 호환용)"""
     try:
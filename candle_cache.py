@@ -0,0 +1,166 @@
+import os
+import numpy as np
+from datetime import datetime
+
+# ==========================================
+# 로컬 OHLCV 캔들 캐시 (심볼/타임프레임별 .npy 파일)
+# ==========================================
+# 저장 형식: float64 (N, 6) 배열 [timestamp_ms, open, high, low, close, volume]
+# - 타임스탬프 오름차순, 첫 캔들 ~ 마지막 캔들까지 빈틈 없이 연속된 구간만 저장
+# - 읽기는 mmap으로 열어 필요한 구간만 잘라서 반환
+# - [NEW] 15m/1h 같은 상위 타임프레임은 기준(1m/5m) 캔들 캐시에서 리샘플링 (추가 다운로드 없음)
+
+TIMEFRAME_UNITS = {'m': 60000, 'h': 3600000, 'd': 86400000, 'w': 604800000}
+
+WEEK_OFFSET_MS = 4 * 86400000  # 1970-01-01(목) -> 첫 월요일까지 (거래소 주봉은 월요일 시작)
+
+def timeframe_to_ms(timeframe):
+    """'5m', '1h' 같은 타임프레임 문자열을 밀리초로 변환"""
+    return int(timeframe[:-1]) * TIMEFRAME_UNITS[timeframe[-1]]
+
+def can_resample(base_timeframe, timeframe):
+    """timeframe 캔들을 base_timeframe 캔들로 만들 수 있는지 (더 길고 정수배)"""
+    base_ms, tf_ms = timeframe_to_ms(base_timeframe), timeframe_to_ms(timeframe)
+    return tf_ms > base_ms and tf_ms % base_ms == 0
+
+def resample_ohlcv(ohlcv, base_timeframe, timeframe, partial=False):
+    """
+    [NEW] 기준 타임프레임 캔들 (N, 6)을 더 긴 타임프레임으로 합침 (벡터 연산)
+    - open = 첫 시가, high = 최고가, low = 최저가, close = 마지막 종가, volume = 합계
+    - partial=False: 기준 캔들이 다 모이지 않은 구간(앞/뒤 미완성, 중간 누락)은 제외
+    """
+    arr = np.asarray(ohlcv, dtype=np.float64).reshape(-1, 6)
+    if timeframe == base_timeframe or len(arr) == 0:
+        return np.array(arr)
+    if not can_resample(base_timeframe, timeframe):
+        raise ValueError(f"{base_timeframe} 캔들로 {timeframe} 캔들을 만들 수 없습니다.")
+    tf_ms = timeframe_to_ms(timeframe)
+    offset = WEEK_OFFSET_MS if timeframe.endswith('w') else 0
+    buckets = (arr[:, 0] - offset) // tf_ms * tf_ms + offset
+
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(arr)]
+    out = np.empty((len(starts), 6), dtype=np.float64)
+    out[:, 0] = buckets[starts]
+    out[:, 1] = arr[starts, 1]
+    out[:, 2] = np.maximum.reduceat(arr[:, 2], starts)
+    out[:, 3] = np.minimum.reduceat(arr[:, 3], starts)
+    out[:, 4] = arr[ends - 1, 4]
+    out[:, 5] = np.add.reduceat(arr[:, 5], starts)
+    if not partial:
+        out = out[(ends - starts) == tf_ms // timeframe_to_ms(base_timeframe)]
+    return out
+
+class CandleCache:
+    def __init__(self, cache_dir="candle_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, symbol, timeframe):
+        safe_symbol = symbol.replace('/', '_').replace(':', '_')
+        return os.path.join(self.cache_dir, f"{safe_symbol}_{timeframe}.npy")
+
+    def load(self, symbol, timeframe):
+        """저장된 캔들 전체 (mmap, 읽기 전용). 없으면 빈 배열"""
+        path = self._path(symbol, timeframe)
+        if not os.path.exists(path):
+            return np.empty((0, 6), dtype=np.float64)
+        return np.load(path, mmap_mode='r')
+
+    def save(self, symbol, timeframe, arr):
+        """임시 파일에 쓴 뒤 교체 (쓰다가 죽어도 기존 캐시 보존)"""
+        path = self._path(symbol, timeframe)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, np.ascontiguousarray(arr, dtype=np.float64))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _to_array(ohlcv):
+        if ohlcv is None or len(ohlcv) == 0:
+            return np.empty((0, 6), dtype=np.float64)
+        return np.asarray(ohlcv, dtype=np.float64).reshape(-1, 6)
+
+    @staticmethod
+    def _merge(*parts):
+        """타임스탬프 기준 병합 + 중복 제거 (뒤에 온 값 우선)"""
+        arr = np.concatenate(parts)
+        if len(arr) == 0: return arr
+        # 역순으로 unique를 잡아야 나중에 받은 캔들이 남음
+        rev = arr[::-1]
+        _, first_idx = np.unique(rev[:, 0], return_index=True)
+        return rev[first_idx]
+
+    def get_range(self, symbol, timeframe, since, until, fetcher, copy=True):
+        """
+        [since, until) 구간 캔들 반환. 캐시에 없는 앞/뒤 구간만 fetcher(since, until)로 받아 채움
+        - 아직 닫히지 않은 캔들(ts + tf > 현재)은 저장하지도 반환하지도 않음
+        - [NEW] copy=False: 복사 없이 view 반환 (캐시만 채우고 mmap으로 다시 읽을 때)
+        """
+        tf_ms = timeframe_to_ms(timeframe)
+        now = int(datetime.now().timestamp() * 1000)
+        since = -(-int(since) // tf_ms) * tf_ms  # 타임프레임 경계로 올림
+        until = min(int(until), now - tf_ms + 1)  # 닫힌 캔들까지만
+
+        cached = self.load(symbol, timeframe)
+        if len(cached) == 0:
+            fetched = self._to_array(fetcher(since, until))
+            fetched = fetched[(fetched[:, 0] >= since) & (fetched[:, 0] < until)]
+            merged = self._merge(fetched)
+            if len(merged) > 0:
+                self.save(symbol, timeframe, merged)
+            return merged
+
+        first_ts, last_ts = int(cached[0, 0]), int(cached[-1, 0])
+        changed = False
+        if since < first_ts or until > last_ts + tf_ms:
+            # 갱신이 필요하면 메모리로 복사 (mmap이 열린 채로는 파일 교체 불가 - Windows)
+            cached = np.array(cached)
+        parts = [cached]
+        unsaved = []  # 캐시와 이어지지 않는 조각: 이번 결과에만 포함
+
+        # 1. 앞쪽 빈 구간
+        if since < first_ts:
+            print(f"📥 캐시 앞쪽 구간 수집: {datetime.fromtimestamp(since/1000)} ~ {datetime.fromtimestamp(first_ts/1000)}")
+            head = self._to_array(fetcher(since, first_ts))
+            head = head[(head[:, 0] >= since) & (head[:, 0] < first_ts)]
+            # 캐시와 이어지는 경우에만 저장 (중간이 비면 연속성 깨짐)
+            if len(head) > 0 and head[:, 0].max() + tf_ms >= first_ts:
+                parts.insert(0, head)
+                changed = True
+            elif len(head) > 0:
+                unsaved.append(head)
+
+        # 2. 뒤쪽 빈 구간
+        if until > last_ts + tf_ms:
+            print(f"📥 캐시 뒤쪽 구간 수집: {datetime.fromtimestamp((last_ts + tf_ms)/1000)} ~ {datetime.fromtimestamp(until/1000)}")
+            tail = self._to_array(fetcher(last_ts + tf_ms, until))
+            tail = tail[(tail[:, 0] > last_ts) & (tail[:, 0] < until)]
+            if len(tail) > 0 and tail[:, 0].min() <= last_ts + tf_ms:
+                parts.append(tail)
+                changed = True
+            elif len(tail) > 0:
+                unsaved.append(tail)
+
+        if changed:
+            merged = self._merge(*parts)
+            self.save(symbol, timeframe, merged)
+        else:
+            merged = cached
+        if unsaved:
+            merged = self._merge(np.asarray(merged), *unsaved)
+
+        lo = np.searchsorted(merged[:, 0], since, side='left')
+        hi = np.searchsorted(merged[:, 0], until, side='left')
+        return np.array(merged[lo:hi]) if copy else merged[lo:hi]
+
+    def get_resampled(self, symbol, timeframe, base_timeframe, since, until, fetcher):
+        """
+        [NEW] [since, until) 구간 timeframe 캔들을 base_timeframe 캐시에서 리샘플링해서 반환
+        - fetcher는 base_timeframe 캔들을 받는 함수 (캐시에 없는 기준 캔들만 다운로드)
+        - 기준 캔들이 아직 다 닫히지 않은 마지막 구간은 제외
+        """
+        tf_ms = timeframe_to_ms(timeframe)
+        offset = WEEK_OFFSET_MS if timeframe.endswith('w') else 0
+        since = (int(since) - offset) // tf_ms * tf_ms + offset  # 첫 구간도 온전히 채우도록 구간 시작으로 내림
+        base = self.get_range(symbol, base_timeframe, since, until, fetcher, copy=False)
+        return resample_ohlcv(base, base_timeframe, timeframe)
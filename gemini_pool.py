@@ -0,0 +1,280 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.api_core import client_options as client_options_lib
+from rate_limit import TokenBucket
+
+# ==========================================
+# API 키별 Gemini 클라이언트 풀
+# ==========================================
+# genai.configure(api_key=...)는 프로세스 전역 설정이라 여러 스레드가 동시에 부르면
+# 다른 키로 요청이 나갈 수 있음. 키마다 독립된 클라이언트를 만들어 두고 재사용함
+# (gRPC 채널이 유지되므로 매 요청마다 새로 연결하지 않음)
+
+class GeminiClientPool:
+    def __init__(self, model_name='gemini-2.5-flash'):
+        self.model_name = model_name
+        self.lock = threading.Lock()
+        self.models = {}  # api_key -> GenerativeModel
+        self.async_models = {}  # api_key -> GenerativeModel (generate_content_async 전용)
+
+    @staticmethod
+    def _options(api_key):
+        return client_options_lib.ClientOptions(api_key=api_key)
+
+    def model_for(self, api_key):
+        """해당 키 전용 모델 (여러 스레드에서 동시에 사용 가능)"""
+        with self.lock:
+            model = self.models.get(api_key)
+            if model is None:
+                model = genai.GenerativeModel(self.model_name)
+                # 전역 기본 클라이언트 대신 키 전용 클라이언트를 직접 지정
+                # 비공개 속성 _client 의존 (0.8.x에서 확인, 버전을 올리면 키가 전역 genai.configure로 돌아가지 않는지 확인)
+                model._client = glm.GenerativeServiceClient(client_options=self._options(api_key))
+                self.models[api_key] = model
+            return model
+
+    def async_model_for(self, api_key):
+        """취소 가능한 비동기 요청용 모델 (봇 이벤트 루프 안에서 사용)"""
+        with self.lock:
+            model = self.async_models.get(api_key)
+            if model is None:
+                model = genai.GenerativeModel(self.model_name)
+                # 비공개 속성 _async_client 의존 (0.8.x에서 확인, requirements.txt 버전 범위 참고)
+                model._async_client = glm.GenerativeServiceAsyncClient(client_options=self._options(api_key))
+                self.async_models[api_key] = model
+            return model
+
+# ==========================================
+# 키 스케줄러 (할당량 / 지연시간 기반)
+# ==========================================
+def is_quota_error(error_str):
+    return "429" in error_str or "Quota exceeded" in error_str or "Resource has been exhausted" in error_str or "quota" in error_str.lower()
+
+class KeyManager:
+    """
+    API 키 스케줄러 (실전 루프 / 백테스트 스레드에서 동시에 사용 가능)
+    - 키별 분당(RPM, 토큰 버킷) / 일일(RPD) 요청 수 추적
+    - 응답 지연시간 EWMA가 가장 낮은 정상 키 우선 배정
+    - 429 발생 시 분당 한도면 잠시, 일일 한도면 리셋 시각까지 정지 후 자동 복구
+    """
+    LATENCY_ALPHA = 0.2  # 지연시간 EWMA 가중치
+
+    def __init__(self, keys_raw, label="Default", rpm=10, rpd=250, reset_utc_hour=8):
+        self.keys = []
+        self.key_names = {}
+        self.error_counts = {} 
+        self.last_errors = {} 
+        self.label = label 
+        self.rpm = rpm
+        self.rpd = rpd
+        self.reset_utc_hour = reset_utc_hour  # 일일 할당량 리셋 시각 (UTC, 기본: 미국 태평양 자정)
+        self.lock = threading.RLock()
+        
+        self.buckets = {}
+        self.daily_counts = {}
+        self.recent_requests = {}  # 최근 60초 요청 시각 (표시용)
+        self.latency_ewma = {}
+        self.latencies = {}  # 최근 응답 지연시간 (백분위 계산용)
+        self.last_used = {}
+        self.quota_strikes = {}  # 연속 429 횟수
+        self.suspended_until = {}  # key -> 복구 시각 (epoch)
+        self.day_id = self._current_day()
+        
+        for item in keys_raw:
+            if ':' in item:
+                k, name = item.split(':', 1)
+                k = k.strip()
+                name = name.strip()
+            else:
+                k = item.strip()
+                name = f"Key-{len(self.keys)+1}"
+            
+            self.keys.append(k)
+            self.key_names[k] = name
+            self.error_counts[k] = 0
+            self.last_errors[k] = "None"
+            self.buckets[k] = TokenBucket(rpm)
+            self.daily_counts[k] = 0
+            self.recent_requests[k] = deque()
+            self.latency_ewma[k] = None
+            self.latencies[k] = deque(maxlen=50)
+            self.last_used[k] = 0.0
+            self.quota_strikes[k] = 0
+
+    def _current_day(self):
+        return int((time.time() - self.reset_utc_hour * 3600) // 86400)
+
+    def next_reset(self):
+        """다음 일일 할당량 리셋 시각 (epoch)"""
+        return (self._current_day() + 1) * 86400 + self.reset_utc_hour * 3600
+
+    def _refresh(self):
+        """날짜가 바뀌었으면 일일 카운터 초기화, 정지 기간이 끝난 키 복구 (lock 보유 상태에서 호출)"""
+        now = time.time()
+        day = self._current_day()
+        if day != self.day_id:
+            self.day_id = day
+            for k in self.keys:
+                self.daily_counts[k] = 0
+        for k, until in list(self.suspended_until.items()):
+            if now >= until:
+                del self.suspended_until[k]
+                self.quota_strikes[k] = 0
+                print(f"✅ API Key 복구됨 ({self.key_names[k]})")
+        for k in self.keys:
+            window = self.recent_requests[k]
+            while window and now - window[0] > 60:
+                window.popleft()
+
+    @property
+    def suspended_keys(self):
+        """현재 정지 중인 키 목록"""
+        with self.lock:
+            self._refresh()
+            return set(self.suspended_until)
+
+    def _wait(self, key):
+        if key in self.suspended_until:
+            return self.suspended_until[key] - time.time()
+        if self.daily_counts[key] >= self.rpd:
+            return float('inf')
+        return self.buckets[key].wait_time()
+
+    def wait_time(self, key):
+        """해당 키를 쓸 수 있을 때까지 남은 시간(초). 오늘 한도 소진 시 inf"""
+        with self.lock:
+            self._refresh()
+            return self._wait(key)
+
+    def _acquire(self, key):
+        self.buckets[key].consume()
+        self.daily_counts[key] += 1
+        self.recent_requests[key].append(time.time())
+        self.last_used[key] = time.monotonic()
+
+    def try_acquire(self, key):
+        """키 사용 예약. 바로 쓸 수 있으면 0을, 아니면 기다려야 할 시간을 반환"""
+        with self.lock:
+            self._refresh()
+            wait = self._wait(key)
+            if wait <= 0:
+                self._acquire(key)
+                return 0
+            return wait
+
+    def get_key(self, exclude=()):
+        """지금 쓸 수 있는 키 중 가장 빠른 키를 예약해서 반환 (없으면 None)"""
+        with self.lock:
+            self._refresh()
+            ready = [k for k in self.keys if k not in exclude and self._wait(k) <= 0]
+            if not ready: return None # 모든 키가 정지/한도 도달
+            # 아직 지연시간 기록이 없는 키는 0으로 보고 먼저 시도, 동률이면 오래 안 쓴 키
+            best = min(ready, key=lambda k: (self.latency_ewma[k] or 0.0, self.last_used[k]))
+            self._acquire(best)
+            return best
+
+    def latency_percentile(self, key, pct, default=None):
+        """최근 응답 지연시간의 pct 백분위(초). 표본이 5개 미만이면 default"""
+        with self.lock:
+            samples = sorted(self.latencies.get(key, ()))
+        if len(samples) < 5: return default
+        pos = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[pos]
+
+    def report_success(self, key, latency):
+        """성공 응답과 지연시간(초) 기록"""
+        with self.lock:
+            if key not in self.latency_ewma: return
+            prev = self.latency_ewma[key]
+            self.latency_ewma[key] = latency if prev is None else self.LATENCY_ALPHA * latency + (1 - self.LATENCY_ALPHA) * prev
+            self.latencies[key].append(latency)
+            self.quota_strikes[key] = 0
+
+    def report_error(self, key, error):
+        """에러 보고. 429(할당량 초과)면 종류에 따라 일시 정지 또는 리셋 시각까지 정지"""
+        with self.lock:
+            if key not in self.error_counts: return
+            self.error_counts[key] += 1
+            error_str = str(error)
+            self.last_errors[key] = error_str
+            
+            if not is_quota_error(error_str): return
+            self.quota_strikes[key] += 1
+            if "PerDay" in error_str or "per day" in error_str.lower():
+                self.suspended_until[key] = self.next_reset()
+                print(f"🚫 API Key 정지됨 ({self.key_names[key]}): 하루 할당량 초과, 리셋 시각에 자동 복구")
+            else:
+                # 분당 한도 등: 연속 발생할수록 길게 쉼 (최대 10분)
+                cooldown = min(600, 20 * (2 ** (self.quota_strikes[key] - 1)))
+                self.buckets[key].cool_down(cooldown)
+                print(f"⏸️ API Key 일시 정지 ({self.key_names[key]}): {cooldown}초 후 재시도")
+
+    def add_status_to_embed(self, embed):
+        """Embed에 상태 필드 추가"""
+        with self.lock:
+            self._refresh()
+            active_count = len(self.keys) - len(self.suspended_until)
+            embed.add_field(name=f"📂 {self.label} Keys", value=f"활성: {active_count} / 총: {len(self.keys)}", inline=False)
+            
+            for k in self.keys:
+                name = self.key_names[k]
+                count = self.error_counts[k]
+                last_err = self.last_errors[k]
+                cooldown = self.buckets[k].blocked_until - time.monotonic()
+                
+                # 상태 아이콘 결정
+                if k in self.suspended_until:
+                    resume = datetime.fromtimestamp(self.suspended_until[k]).strftime('%H:%M')
+                    status = f"⛔ 하루 제한 초과 ({resume} 자동 복구)"
+                elif self.daily_counts[k] >= self.rpd:
+                    status = "⛔ 오늘 요청 한도 도달"
+                elif cooldown > 0:
+                    status = f"⏸️ 일시 정지 ({int(cooldown)}초)"
+                elif count == 0: 
+                    status = "🟢 정상"
+                elif count < 5: 
+                    status = f"🟡 불안정 ({count}회)"
+                else: 
+                    status = f"🔴 오류 다수 ({count}회)"
+                
+                latency = self.latency_ewma[k]
+                latency_text = f"{latency:.1f}초" if latency is not None else "-"
+                usage = f"오늘 {self.daily_counts[k]}/{self.rpd} · 분당 {len(self.recent_requests[k])}/{self.rpm} · 지연 {latency_text}"
+                err_msg = last_err if last_err == "None" else f"⚠️ {last_err[:30]}..."
+                
+                embed.add_field(
+                    name=f"🏷️ {name} ({self.label})", 
+                    value=f"**상태:** {status}\n**사용량:** {usage}\n**로그:** {err_msg}", 
+                    inline=False
+                )
+
+class HedgeStats:
+    """헤지(중복) 요청 통계: 발동 비율과 헤지 여부별 평균 지연시간"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0  # 보조 키 응답이 먼저 도착한 횟수
+        self.latency_sum = {True: 0.0, False: 0.0}
+
+    def record(self, hedged, hedge_won, latency):
+        with self.lock:
+            self.requests += 1
+            self.latency_sum[hedged] += latency
+            if hedged:
+                self.hedged += 1
+                if hedge_won: self.hedge_wins += 1
+
+    def summary(self):
+        with self.lock:
+            if self.requests == 0: return "기록 없음"
+            plain = self.requests - self.hedged
+            avg_plain = self.latency_sum[False] / plain if plain else 0
+            avg_hedged = self.latency_sum[True] / self.hedged if self.hedged else 0
+            rate = self.hedged / self.requests * 100
+            return (f"발동 {self.hedged}/{self.requests} ({rate:.0f}%) · 보조 키 승리 {self.hedge_wins}회\n"
+                    f"평균 지연: 일반 {avg_plain:.1f}초 / 헤지 {avg_hedged:.1f}초")
@@ -0,0 +1,92 @@
+import numpy as np
+import settlement
+from candle_cache import CandleCache, timeframe_to_ms
+
+# ==========================================
+# 캔들 안 SL/TP 선후 판정 (하위 타임프레임 드릴다운)
+# ==========================================
+# - 정산은 먼저 5m 고가/저가로만 SL/TP 터치를 확인 (settlement.find_exit + bars)
+# - SL과 TP가 한 캔들에 같이 닿은 경우에만 그 캔들의 1m 하위 캔들을 읽어 먼저 닿은 쪽을 정함
+#   -> 전체 기간 1m 데이터 없이, 애매한 캔들 몇 개 분량만 읽음
+# - 하위 캔들은 1m 캐시에 있으면 mmap에서 잘라 쓰고, 없으면 fetcher로 그 캔들부터 FETCH_BLOCK개를 받아 기억
+#   (요청 1회로 뒤따르는 애매한 캔들까지 커버, 캐시에는 저장 안 함 - 캐시는 연속 구간만 저장)
+# - 하위 캔들을 못 구하거나 1m 캔들 하나에서도 둘 다 닿으면 SL 우선 (보수적)
+
+DRILL_TIMEFRAME = "1m"
+FETCH_BLOCK = 1500  # 다운로드 1회에 받는 하위 캔들 수 (바이낸스 klines limit)
+
+def can_drill(timeframe, drill_timeframe=DRILL_TIMEFRAME):
+    """timeframe 캔들을 drill_timeframe 캔들로 나눠 볼 수 있는지 (더 짧고 나누어 떨어짐)"""
+    tf_ms, drill_ms = timeframe_to_ms(timeframe), timeframe_to_ms(drill_timeframe)
+    return tf_ms > drill_ms and tf_ms % drill_ms == 0
+
+class IntrabarResolver:
+    """
+    settlement.find_exit의 resolve 인자로 쓰는 판정기: resolver(ts, side, sl, tp) -> "SL" / "TP" / None
+    - ts: 판정할 캔들 시작 시각 (ms)
+    - fetcher(since, until): 캐시에 없는 하위 캔들 다운로드 함수, 정렬된 ccxt 형식 (None이면 캐시만 사용 - 프로세스 풀 워커용)
+    """
+    def __init__(self, symbol, timeframe, drill_timeframe=DRILL_TIMEFRAME, cache_dir="candle_cache", fetcher=None):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.drill_timeframe = drill_timeframe
+        self.cache_dir = cache_dir
+        self.fetcher = fetcher
+        self.span = timeframe_to_ms(timeframe)
+        self.count = self.span // timeframe_to_ms(drill_timeframe)  # 캔들 1개 = 하위 캔들 수
+        self.sub = {}  # {ts: 하위 캔들 (count, 6) 또는 None}
+        self.stats = {'drilled': 0, 'fetched': 0, 'fallback': 0}
+        self._cached = None
+
+    def __getstate__(self):
+        # 워커로 보낼 때는 설정만 (mmap/다운로드 함수/메모 제외)
+        state = self.__dict__.copy()
+        state.update(fetcher=None, sub={}, _cached=None)
+        return state
+
+    def _load_cached(self):
+        if self._cached is None:
+            self._cached = CandleCache(self.cache_dir).load(self.symbol, self.drill_timeframe)
+        return self._cached
+
+    def sub_candles(self, ts):
+        """ts 캔들 구간의 하위 캔들 (빠진 캔들이 있으면 None)"""
+        if ts in self.sub: return self.sub[ts]
+        cached = self._load_cached()
+        lo = int(np.searchsorted(cached[:, 0], ts, side='left'))
+        hi = int(np.searchsorted(cached[:, 0], ts + self.span, side='left'))
+        sub = np.array(cached[lo:hi]) if hi - lo == self.count else None
+        if sub is None and self.fetcher is not None:
+            self._fetch_block(ts)
+            return self.sub.setdefault(ts, None)
+        self.sub[ts] = sub
+        return sub
+
+    def _fetch_block(self, ts):
+        """ts 캔들부터 FETCH_BLOCK개 하위 캔들을 받아 캔들별로 나눠 기억"""
+        until = ts + (FETCH_BLOCK // self.count) * self.span
+        try:
+            fetched = np.asarray(self.fetcher(ts, until), dtype=np.float64).reshape(-1, 6)
+        except Exception as e:
+            print(f"⚠️ {self.drill_timeframe} 하위 캔들 수집 실패 ({ts}): {e}")
+            return
+        self.stats['fetched'] += 1
+        fetched = fetched[(fetched[:, 0] >= ts) & (fetched[:, 0] < until)]
+        starts = (fetched[:, 0] - ts) // self.span * self.span + ts
+        for start in np.unique(starts):
+            rows = fetched[starts == start]
+            self.sub.setdefault(int(start), rows if len(rows) == self.count else None)
+
+    def __call__(self, ts, side, sl, tp):
+        sub = self.sub_candles(int(ts))
+        if sub is None:
+            self.stats['fallback'] += 1
+            return None
+        self.stats['drilled'] += 1
+        bars = {'open': sub[:, 1], 'high': sub[:, 2], 'low': sub[:, 3], 'ts': sub[:, 0].astype(np.int64)}
+        _, reason = settlement.find_exit(sub[:, 4], 0, side, sl, tp, bars=bars)
+        return reason
+
+    def summary(self):
+        s = self.stats
+        return f"{self.drill_timeframe} 드릴다운 {s['drilled']}회 (다운로드 {s['fetched']}회, 판정 불가 {s['fallback']}회 -> SL 우선)"
@@ -9,12 +9,15 @@ from datetime import datetime
 import pyupbit
 import ccxt
 import pandas as pd
-import google.generativeai as genai
-from paper_exchange import FuturesWallet 
-from parallel_backtester import Backtester 
+from paper_exchange import FuturesWallet, DecisionCache, TradeDB, BacktestDB
+from parallel_backtester import Backtester, parse_sim_params, timeframe_label, RESULTS_DB
+from gemini_pool import GeminiClientPool, KeyManager, HedgeStats
+from market_feed import KlineStream, MarketDataHub, CandleCloseScheduler
 import brain
+import settlement
 import traceback
 import re
+from collections import OrderedDict
 
 # ==========================================
 # 0. 설정 및 키 관리
@@ -49,85 +52,31 @@ ALL_KEYS_RAW = config.get('GEMINI_API_KEYS', [])
 # 환율
 USD_KRW_RATE = 1450 
 
-class KeyManager:
-    def __init__(self, keys_raw, label="Default"):
-        self.keys = []
-        self.key_names = {}
-        self.error_counts = {} 
-        self.last_errors = {} 
-        self.suspended_keys = set() # [NEW] 사용 중지된 키 목록
-        self.idx = 0
-        self.label = label 
-        
-        for item in keys_raw:
-            if ':' in item:
-                k, name = item.split(':', 1)
-                k = k.strip()
-                name = name.strip()
-            else:
-                k = item.strip()
-                name = f"Key-{len(self.keys)+1}"
-            
-            self.keys.append(k)
-            self.key_names[k] = name
-            self.error_counts[k] = 0
-            self.last_errors[k] = "None"
-
-    def get_key(self):
-        """살아있는 키를 라운드 로빈으로 반환"""
-        if not self.keys: return None
-        
-        start_idx = self.idx
-        # 한 바퀴 돌 때까지 사용 가능한 키 찾기
-        for _ in range(len(self.keys)):
-            k = self.keys[self.idx]
-            self.idx = (self.idx + 1) % len(self.keys)
-            
-            if k not in self.suspended_keys:
-                return k
-        
-        return None # 모든 키가 정지됨
-    
-    def report_error(self, key, error):
-        """에러 보고 및 429(할당량 초과) 감지 시 키 정지"""
-        if key in self.error_counts:
-            self.error_counts[key] += 1
-            error_str = str(error)
-            self.last_errors[key] = error_str
-            
-            # [NEW] 할당량 초과 에러 감지
-            if "429" in error_str or "Quota exceeded" in error_str:
-                if key not in self.suspended_keys:
-                    self.suspended_keys.add(key)
-                    print(f"🚫 API Key 정지됨 ({self.key_names[key]}): 하루 할당량 초과")
-
-    def add_status_to_embed(self, embed):
-        """Embed에 상태 필드 추가"""
-        active_count = len(self.keys) - len(self.suspended_keys)
-        embed.add_field(name=f"📂 {self.label} Keys", value=f"활성: {active_count} / 총: {len(self.keys)}", inline=False)
-        
-        for k in self.keys:
-            name = self.key_names[k]
-            count = self.error_counts[k]
-            last_err = self.last_errors[k]
-            
-            # 상태 아이콘 결정
-            if k in self.suspended_keys:
-                status = "⛔ 하루 제한 초과 (사용 중지)"
-            elif count == 0: 
-                status = "🟢 정상"
-            elif count < 5: 
-                status = f"🟡 불안정 ({count}회)"
-            else: 
-                status = f"🔴 오류 다수 ({count}회)"
-            
-            err_msg = last_err if last_err == "None" else f"⚠️ {last_err[:30]}..."
-            
-            embed.add_field(
-                name=f"🏷️ {name} ({self.label})", 
-                value=f"**상태:** {status}\n**로그:** {err_msg}", 
-                inline=False
-            )
+# 실전 판단 프롬프트 버전 (문구 변경 시 올려야 AI 캐시가 섞이지 않음)
+LIVE_PROMPT_VERSION = "live-v2"
+
+# [NEW] 헤지 요청 설정: 1차 키 응답이 최근 지연시간 백분위를 넘기면 보조 키로 중복 요청
+LIVE_HEDGE_ENABLED = bool(config.get('LIVE_HEDGE_ENABLED', False))
+LIVE_HEDGE_PERCENTILE = float(config.get('LIVE_HEDGE_PERCENTILE', 90))
+LIVE_HEDGE_MIN_DELAY = 1.0 # 최소 대기(초): 너무 빨리 헤지해 할당량 낭비하지 않도록
+LIVE_HEDGE_DEFAULT_DELAY = 5.0 # 지연시간 표본이 부족할 때 대기(초)
+
+# [NEW] 작업별 주기(초): 매매 판단 / 매매 현황 임베드 / 키 관리 임베드가 각자 독립적으로 동작
+LIVE_TRADING_INTERVAL = float(config.get('LIVE_TRADING_INTERVAL', 10))
+DASHBOARD_INTERVAL = float(config.get('DASHBOARD_INTERVAL', 10))
+KEY_DASHBOARD_INTERVAL = float(config.get('KEY_DASHBOARD_INTERVAL', 10))
+
+# [NEW] 진입 판단은 5분봉 마감 직후 실행. 선행 판단: 마감 N초 전 미완성 캔들로 미리 질의 (0 = 끔)
+LIVE_SPECULATIVE_SECONDS = float(config.get('LIVE_SPECULATIVE_SECONDS', 0))
+LIVE_SPECULATIVE_TOLERANCE = float(config.get('LIVE_SPECULATIVE_TOLERANCE', 0.001)) # 종가 허용 오차 (비율)
+
+# [NEW] 멀티 심볼 실전 모의매매: 심볼마다 지갑/지표/판단 스케줄이 따로 돌고, 거래소·AI 호출은 공용 한도를 나눠 씀
+LIVE_SYMBOLS = config.get('LIVE_SYMBOLS', ["BTC/USDT"])
+LIVE_TIMEFRAME = config.get('LIVE_TIMEFRAME', "5m") # [NEW] 실전 판단 캔들 (거래소 스트림이 타임프레임별로 제공)
+LIVE_INITIAL_BALANCE = float(config.get('LIVE_INITIAL_BALANCE', 1000)) # 심볼당 초기자금 (USDT)
+LIVE_EXCHANGE_CONCURRENCY = int(config.get('LIVE_EXCHANGE_CONCURRENCY', 4)) # 거래소 REST 동시 호출 수
+LIVE_AI_CONCURRENCY = int(config.get('LIVE_AI_CONCURRENCY', 2)) # 실전 AI 판단 동시 요청 수
+MARKET_DATA_TTL = float(config.get('MARKET_DATA_TTL', 3))
 
 # ==========================================
 # 키 분류 및 매니저 초기화
@@ -153,8 +102,14 @@ for raw_item in ALL_KEYS_RAW:
     else:
         print(f"  ⚠️ 형식 오류: {raw_item}")
 
-key_manager_live = KeyManager(live_keys_list, label="Live Trading (a)")
-key_manager_backtest = KeyManager(backtest_keys_list, label="Backtesting (b)")
+key_manager_live = KeyManager(
+    live_keys_list, label="Live Trading (a)",
+    rpm=int(config.get('LIVE_KEY_RPM', 10)), rpd=int(config.get('LIVE_KEY_RPD', 250))
+)
+key_manager_backtest = KeyManager(
+    backtest_keys_list, label="Backtesting (b)",
+    rpm=int(config.get('BACKTEST_KEY_RPM', 10)), rpd=int(config.get('BACKTEST_KEY_RPD', 250))
+)
 
 # ==========================================
 # 1. 봇 및 변수 초기화
@@ -163,8 +118,30 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
-backtester = Backtester(api_keys=key_manager_backtest.keys)
-live_wallet = None 
+decision_cache = DecisionCache() # [NEW] 실전/백테스트 공용 AI 판단 캐시
+gemini_pool = GeminiClientPool('gemini-2.5-flash') # [NEW] 키별 독립 Gemini 클라이언트
+hedge_stats = HedgeStats() # [NEW] 헤지 요청 통계
+translation_cache = OrderedDict() # [NEW] 판단 이유 번역 캐시 (LRU)
+TRANSLATION_CACHE_SIZE = 256
+background_tasks = set() # [NEW] 진입 알림 등 백그라운드 작업 (GC 방지용 참조 보관)
+backtester = Backtester(
+    key_manager=key_manager_backtest,
+    decision_cache=decision_cache,
+    client_pool=gemini_pool,
+    lazy_eval=bool(config.get('BACKTEST_LAZY_EVAL', False)), # [NEW] 포지션 없는 캔들만 AI 질의
+    batch_size=int(config.get('BACKTEST_BATCH_SIZE', 1)), # [NEW] 요청 1회당 캔들 수 (1 = 기존 방식)
+    compact_window=int(config.get('BACKTEST_COMPACT_WINDOW', 0)), # [NEW] >0: 긴 구간을 이 캔들 수 단위로 흘려 처리 (0 = 기존 방식)
+    timeframe=config.get('BACKTEST_TIMEFRAME', "5m"), # [NEW] 판단/정산 타임프레임 (기준 캔들의 정수배면 리샘플링)
+    base_timeframe=config.get('BACKTEST_BASE_TIMEFRAME', "5m"), # [NEW] 다운로드/캐시하는 기준 캔들
+    context_timeframes=config.get('BACKTEST_CONTEXT_TIMEFRAMES', []), # [NEW] 프롬프트에 함께 넣을 상위 타임프레임
+    intrabar=bool(config.get('BACKTEST_INTRABAR', True)), # [NEW] 캔들 고가/저가로 SL/TP 정산 (False = 종가만)
+    drill_timeframe=config.get('BACKTEST_DRILL_TIMEFRAME', "1m") # [NEW] SL/TP 동시 터치 캔들만 이 하위 캔들로 선후 판정
+)
+trade_db = TradeDB() # [NEW] 모든 심볼 지갑이 공유하는 거래 기록 DB
+backtest_db = BacktestDB(db_name=RESULTS_DB) # [NEW] 백테스트 기록 조회 명령 공용 연결
+exchange_limiter = asyncio.Semaphore(LIVE_EXCHANGE_CONCURRENCY) # [NEW] 심볼 공용 거래소 호출 한도
+ai_limiter = asyncio.Semaphore(LIVE_AI_CONCURRENCY) # [NEW] 심볼 공용 AI 호출 한도
+speculation_stats = {'hit': 0, 'miss': 0}
 is_live_active = False
 dashboard_msg = None 
 key_dashboard_msg = None 
@@ -177,9 +154,47 @@ binance = ccxt.binanceusdm({
 # ==========================================
 # 2. 헬퍼 함수
 # ==========================================
+class LoopMonitor:
+    """[NEW] 주기 작업 실행 시간 측정 + 주기 초과(overrun) 감지. `with monitor:`로 감싸서 사용"""
+    def __init__(self, name, interval):
+        self.name = name
+        self.interval = interval
+        self.runs = 0
+        self.overruns = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.last_duration = time.monotonic() - self._started
+        self.max_duration = max(self.max_duration, self.last_duration)
+        self.runs += 1
+        if self.last_duration > self.interval:
+            self.overruns += 1
+            print(f"⏱️ [{self.name}] 주기 초과: {self.last_duration:.1f}초 (주기 {self.interval:g}초)")
+        return False
+
+    def summary(self):
+        return f"{self.name}: 최근 {self.last_duration:.1f}초 / 최대 {self.max_duration:.1f}초 · 초과 {self.overruns}/{self.runs}회"
+
+loop_monitors = {
+    'trading': LoopMonitor("매매", LIVE_TRADING_INTERVAL),
+    'dashboard': LoopMonitor("매매 현황", DASHBOARD_INTERVAL),
+    'key': LoopMonitor("키 관리", KEY_DASHBOARD_INTERVAL)
+}
+dashboard_lock = asyncio.Lock() # [NEW] 주기 갱신과 진입 직후 갱신이 겹쳐 메시지가 중복 생성되지 않도록
+
 def usdt_to_krw(usdt):
     return int(usdt * USD_KRW_RATE)
 
+def format_usdt(price):
+    """가격 표시 (1달러 미만 알트코인은 유효숫자 위주로)"""
+    return f"${price:,.2f}" if price >= 1 else f"${price:.6f}"
+
 async def send_split_field_embed(channel, base_embed, field_name, long_text):
     limit = 1000 
     if not long_text: long_text = "내용 없음"
@@ -206,8 +221,7 @@ async def send_split_description_embed(channel, title, long_text, color):
 # ==========================================
 # 3. AI 관련 함수
 # ==========================================
-async def ask_ai_decision(df):
-    used_key = None
+async def ask_ai_decision(df, symbol="BTC/USDT", timeframe="5m"):
     try:
         if df.empty: return {"decision": "hold", "confidence": 0}
         
@@ -215,7 +229,7 @@ async def ask_ai_decision(df):
         row = df.iloc[-1]
         
         data_str = f"""
-        [Current Market Data (5m Candle)]
+        [Current Market Data ({symbol} {timeframe} Candle)]
         - Timestamp: {row.name}
         - Close Price: {row['close']}
         - Volume Ratio: {row['vol_ratio']:.2f} (vs 20-period Avg)
@@ -236,10 +250,10 @@ async def ask_ai_decision(df):
         """
         
         prompt = f"""
-        Act as a World-Class Bitcoin Futures Trader (Scalper).
+        Act as a World-Class Crypto Futures Trader (Scalper).
         Your goal is to maximize profit while strictly managing risk.
         
-        Based on the provided 5-minute chart data:
+        Based on the provided {timeframe_label(timeframe)} chart data:
         1. Analyze the **Trend** using EMA and recent price action.
         2. Analyze **Momentum** using RSI and MACD.
         3. Confirm trade validity with **Volume Ratio** (High volume = Stronger signal).
@@ -257,34 +271,138 @@ async def ask_ai_decision(df):
         {{"decision": "long/short/hold", "confidence": 0-100, "sl": price, "tp": price, "reason": "Brief logic in Korean"}}
         """
         
-        # [중요] 살아있는 키만 가져옴 (없으면 None)
-        used_key = key_manager_live.get_key()
-        if not used_key: 
-            print("❌ [Critical] 모든 실전용 API 키가 한도 초과로 정지되었습니다.")
-            return {"decision": "hold", "confidence": 0}
-        
-        genai.configure(api_key=used_key)
-        model = genai.GenerativeModel('gemini-2.5-flash') 
+        # [NEW] 동일한 시장 데이터로 이미 받은 판단이 있으면 재사용 (SQLite 조회/커밋은 스레드에서 - 이벤트 루프 블로킹 방지)
+        cached = await asyncio.to_thread(decision_cache.get, 'gemini-2.5-flash', LIVE_PROMPT_VERSION, data_str)
+        if cached is not None: return cached
         
-        response = await asyncio.to_thread(model.generate_content, prompt)
+        async with ai_limiter: # [NEW] 여러 심볼이 동시에 마감돼도 AI 동시 요청 수 제한
+            result = await request_decision_hedged(prompt)
+        if result is None: return {"decision": "hold", "confidence": 0}
+        await asyncio.to_thread(decision_cache.put, 'gemini-2.5-flash', LIVE_PROMPT_VERSION, data_str, result)
+        return result
+    except Exception as e:
+        print(f"⚠️ AI Error: {e}")
+        return {"decision": "hold", "confidence": 0}
+
+async def _request_decision(key, prompt):
+    """키 1개로 판단 요청 후 JSON 반환 (실패 시 예외, 취소 가능)"""
+    model = gemini_pool.async_model_for(key)
+    started = time.monotonic()
+    try:
+        response = await model.generate_content_async(prompt)
         text = response.text.replace("```json", "").replace("```", "").strip()
-        return json.loads(text)
+        result = json.loads(text)
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        print(f"⚠️ AI Error ({key_manager_live.key_names.get(used_key, 'Unknown')}): {e}")
+        print(f"⚠️ AI Error ({key_manager_live.key_names.get(key, 'Unknown')}): {e}")
         # 에러 리포트 시 429면 내부적으로 정지 처리됨
-        if used_key: key_manager_live.report_error(used_key, e)
-        return {"decision": "hold", "confidence": 0}
+        key_manager_live.report_error(key, e)
+        raise
+    key_manager_live.report_success(key, time.monotonic() - started)
+    return result
+
+async def request_decision_hedged(prompt):
+    """
+    [NEW] 헤지 요청: 1차 키가 평소 지연시간(백분위)을 넘기면 다른 키로 같은 요청을 한 번 더 보냄
+    - 먼저 도착한 유효한 JSON을 사용하고 나머지 요청은 취소
+    - 헤지 비활성 시 1차 키 응답만 기다림
+    """
+    # [중요] 살아있는 키만 가져옴 (없으면 None)
+    primary = key_manager_live.get_key()
+    if not primary: 
+        print("❌ [Critical] 모든 실전용 API 키가 한도 초과로 정지되었습니다.")
+        return None
+    
+    started = time.monotonic()
+    tasks = {asyncio.create_task(_request_decision(primary, prompt)): primary}
+    pending = set(tasks)
+    hedged = False  # 보조 키 요청을 실제로 보냈는지 (통계용)
+    deadline_passed = False  # 헤지 시점이 지났는지 (보조 키가 없어도 타임아웃 재설정 중단)
+    hedge_at = None
+    if LIVE_HEDGE_ENABLED:
+        delay = key_manager_live.latency_percentile(primary, LIVE_HEDGE_PERCENTILE, default=LIVE_HEDGE_DEFAULT_DELAY)
+        hedge_at = started + max(LIVE_HEDGE_MIN_DELAY, delay)
+    
+    result, winner = None, None
+    try:
+        while pending:
+            timeout = None
+            if hedge_at is not None and not deadline_passed:
+                timeout = max(0, hedge_at - time.monotonic())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            
+            for task in done:
+                # 같은 묶음의 실패 태스크도 예외를 꺼내 둠 ("Task exception was never retrieved" 방지)
+                if task.exception() is None and result is None:
+                    result, winner = task.result(), tasks[task]
+            if result is not None: break
+            
+            # 1차 키가 느리거나 실패 → 보조 키로 1회 헤지
+            if hedge_at is not None and not deadline_passed:
+                deadline_passed = True
+                secondary = key_manager_live.get_key(exclude={primary})
+                if secondary:
+                    task = asyncio.create_task(_request_decision(secondary, prompt))
+                    tasks[task] = secondary
+                    pending.add(task)
+                    hedged = True
+    finally:
+        for task in pending:
+            task.cancel()
+    
+    if result is not None:
+        hedge_stats.record(hedged, winner != primary, time.monotonic() - started)
+    return result
+
+def is_korean(text):
+    """한글이 포함되어 있으면 이미 한국어 응답으로 간주"""
+    return re.search(r'[가-힣]', text) is not None
 
 async def translate_reason(text):
+    # [NEW] 판단 프롬프트가 이미 한국어 이유를 요구하므로 대부분 번역 없이 통과
+    if not text or is_korean(text): return text
+    if text in translation_cache:
+        translation_cache.move_to_end(text)
+        return translation_cache[text]
+    
     used_key = key_manager_live.get_key()
     if not used_key: return text
     try:
-        genai.configure(api_key=used_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        model = gemini_pool.model_for(used_key)
         prompt = f"Translate this trading reasoning into natural Korean:\n'{text}'"
+        started = time.monotonic()
         response = await asyncio.to_thread(model.generate_content, prompt)
-        return response.text.strip()
-    except: return text
+        key_manager_live.report_success(used_key, time.monotonic() - started)
+        translated = response.text.strip()
+        translation_cache[text] = translated
+        if len(translation_cache) > TRANSLATION_CACHE_SIZE:
+            translation_cache.popitem(last=False)
+        return translated
+    except Exception as e:
+        key_manager_live.report_error(used_key, e)
+        return text
+
+def run_in_background(coro):
+    """매매 루프를 막지 않도록 작업을 분리 실행 (예외는 로그만 남김)"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    def _done(t):
+        background_tasks.discard(t)
+        if not t.cancelled() and t.exception():
+            print(f"⚠️ 백그라운드 작업 오류: {t.exception()}")
+    task.add_done_callback(_done)
+    return task
+
+async def announce_entry(symbol, side, confidence, entry_price, reason):
+    """[NEW] 진입 후 이유 번역 + 설명 채널 알림 (진입 경로 밖에서 실행)"""
+    reason_kr = await translate_reason(reason)
+    ch = bot.get_channel(EXPLAIN_ID)
+    if ch:
+        embed = discord.Embed(title=f"🚀 AI 진입 신호: {symbol} {side.upper()}", color=0x0000ff)
+        embed.add_field(name="확신도", value=f"{confidence}%", inline=True)
+        embed.add_field(name="진입가", value=format_usdt(entry_price), inline=True)
+        await send_split_field_embed(ch, embed, "판단 이유", reason_kr)
 
 async def analyze_failure(trade_info, df_context):
     used_key = None
@@ -292,8 +410,7 @@ async def analyze_failure(trade_info, df_context):
         used_key = key_manager_live.get_key()
         if not used_key: return "API 키 없음 (전부 정지됨)"
         
-        genai.configure(api_key=used_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        model = gemini_pool.model_for(used_key)
         prompt = f"""
         Act as a Wall Street Senior Trader.
         My bot just lost money. Analyze why.
@@ -310,7 +427,9 @@ async def analyze_failure(trade_info, df_context):
         
         Output: A harsh, constructive feedback in Korean. (반말 모드)
         """
+        started = time.monotonic()
         response = await asyncio.to_thread(model.generate_content, prompt)
+        key_manager_live.report_success(used_key, time.monotonic() - started)
         return response.text.strip()
     except Exception as e:
         if used_key: key_manager_live.report_error(used_key, e)
@@ -322,73 +441,73 @@ async def analyze_failure(trade_info, df_context):
 
 async def update_trading_embed():
     """실시간 매매 현황 임베드 업데이트"""
+    async with dashboard_lock:
+        await _update_trading_embed()
+
+async def _update_trading_embed():
     global dashboard_msg
     ch_dash = bot.get_channel(DASHBOARD_ID)
     if not ch_dash: return
 
-    try:
-        ticker = await asyncio.to_thread(binance.fetch_ticker, "BTC/USDT")
-        current_usdt_price = ticker['last']
-    except:
-        current_usdt_price = 0
-
-    if live_wallet:
-        bal_usdt = live_wallet.get_balance()
-        initial_usdt = live_wallet.initial_balance
-        unrealized_usdt = live_wallet.get_unrealized_pnl(current_usdt_price) if live_wallet.position else 0
-        total_equity_usdt = bal_usdt + unrealized_usdt
-        
-        total_roi = ((total_equity_usdt - initial_usdt) / initial_usdt * 100) if initial_usdt > 0 else 0
+    engines = [engine for engine in live_engines.values() if engine.wallet]
+    symbol_fields = []
+    if engines:
+        # [NEW] 심볼별 현재가를 동시에 조회 (스트림 최신가 또는 REST, 허브 TTL 캐시)
+        prices = await asyncio.gather(*(engine.hub.get_price() for engine in engines), return_exceptions=True)
+        prices = [p if isinstance(p, (int, float)) else 0 for p in prices]
         
-        status_text = "💤 관망 중 (Binance USDT)"
-        pnl_text = "-"
-        entry_text = "-"
-        sl_tp_text = "-"
-        color = 0x95a5a6 
+        total_equity_usdt = 0
+        initial_usdt = 0
+        open_positions = 0
+        for engine, price in zip(engines, prices):
+            wallet = engine.wallet
+            unrealized_usdt = wallet.get_unrealized_pnl(price) if wallet.position and price else 0
+            total_equity_usdt += wallet.get_balance() + unrealized_usdt
+            initial_usdt += wallet.initial_balance
+            
+            value = "💤 관망 중"
+            if wallet.position:
+                open_positions += 1
+                pos = wallet.position
+                pnl_rate_curr = (unrealized_usdt / pos['invested_krw']) * 100
+                sl, tp = pos.get('sl'), pos.get('tp')
+                sl_text = format_usdt(sl) if sl else "-"
+                tp_text = format_usdt(tp) if tp else "-"
+                value = (f"🔥 {pos['type'].upper()} @ {format_usdt(pos['entry_price'])}\n"
+                         f"손익: ${unrealized_usdt:.2f} ({pnl_rate_curr:+.2f}%)\n"
+                         f"SL: {sl_text} | TP: {tp_text}")
+            symbol_fields.append((f"{engine.symbol} · {format_usdt(price)}", value))
         
-        if live_wallet.position:
-            pos = live_wallet.position
-            side = pos['type'].upper()
-            status_text = f"🔥 {side} 포지션 (Binance)"
+        total_roi = ((total_equity_usdt - initial_usdt) / initial_usdt * 100) if initial_usdt > 0 else 0
+        status_text = f"🔥 포지션 {open_positions}/{len(engines)}개 보유" if open_positions else f"💤 관망 중 ({len(engines)}개 심볼)"
+        if open_positions:
             color = 0x2ecc71 if total_roi >= 0 else 0xe74c3c
-            
-            pnl_krw = usdt_to_krw(unrealized_usdt)
-            pnl_rate_curr = (unrealized_usdt / pos['invested_krw']) * 100
-            
-            pnl_text = f"${unrealized_usdt:.2f} ({pnl_rate_curr:+.2f}%)\n≈ {pnl_krw:,}원"
-            entry_text = f"${pos['entry_price']:.2f}"
-            
-            sl, tp = pos.get('sl'), pos.get('tp')
-            sl_text = f"${sl:.2f}" if sl else "-"
-            tp_text = f"${tp:.2f}" if tp else "-"
-            sl_tp_text = f"SL: {sl_text} | TP: {tp_text}"
+        else:
+            color = 0x95a5a6
             
         desc = f"Last Update: {datetime.now().strftime('%H:%M:%S')}\nMarket: Binance Futures (USDT)"
+        ages = [engine.hub.age('price') for engine in engines if engine.hub.age('price') is not None]
+        if ages:
+            desc += f"\n시세 기준: 최대 {max(ages):.1f}초 전"
     else:
         status_text = "⛔ 봇 대기 중"
         color = 0x2f3136
-        current_usdt_price = 0
         total_roi = 0.0
         total_equity_usdt = 0
-        pnl_text = "-"
-        entry_text = "-"
-        sl_tp_text = "-"
         desc = "봇 준비 완료. `!테스트매매시작`을 입력하세요."
 
     equity_krw = usdt_to_krw(total_equity_usdt)
-    curr_price_krw = usdt_to_krw(current_usdt_price)
 
     embed = discord.Embed(title="🔴 실시간 AI 트레이딩 (Binance)", description=desc, color=color)
-    embed.add_field(name="BTC 현재가", value=f"**${current_usdt_price:,.2f}**\n(≈{curr_price_krw:,}원)", inline=True)
-    embed.add_field(name="누적 수익률", value=f"**{total_roi:+.2f}%**", inline=True)
     embed.add_field(name="총 평가 자산", value=f"${total_equity_usdt:,.2f}\n(≈{equity_krw:,}원)", inline=True)
+    embed.add_field(name="누적 수익률", value=f"**{total_roi:+.2f}%**", inline=True)
+    embed.add_field(name="상태", value=status_text, inline=True)
     
-    embed.add_field(name="상태", value=status_text, inline=False)
-    embed.add_field(name="진입가 (USDT)", value=entry_text, inline=True)
-    embed.add_field(name="평가 손익", value=pnl_text, inline=True)
-    embed.add_field(name="전략 (USDT)", value=sl_tp_text, inline=False)
+    # [NEW] 심볼별 요약 (임베드 필드 제한 25개 고려)
+    for name, value in symbol_fields[:20]:
+        embed.add_field(name=name, value=value, inline=True)
     
-    embed.set_footer(text="Binance USDT 마켓 기준 (10초 갱신)")
+    embed.set_footer(text=f"Binance USDT 마켓 기준 ({DASHBOARD_INTERVAL:g}초 갱신)")
 
     try:
         if dashboard_msg: await dashboard_msg.edit(embed=embed)
@@ -409,144 +528,267 @@ async def update_key_embed():
     
     key_manager_live.add_status_to_embed(embed)
     key_manager_backtest.add_status_to_embed(embed)
+    if LIVE_HEDGE_ENABLED:
+        embed.add_field(name="🛡️ 헤지 요청", value=hedge_stats.summary(), inline=False)
+    if LIVE_SPECULATIVE_SECONDS > 0:
+        embed.add_field(name="🔮 선행 판단", value=f"채택 {speculation_stats['hit']}회 / 폐기 {speculation_stats['miss']}회", inline=False)
+    embed.add_field(name="⏱️ 작업 주기", value="\n".join(m.summary() for m in loop_monitors.values()), inline=False)
     
     try:
         if key_dashboard_msg: await key_dashboard_msg.edit(embed=embed)
         else: key_dashboard_msg = await ch.send(embed=embed)
     except: pass
 
-@tasks.loop(seconds=10)
+@tasks.loop(seconds=KEY_DASHBOARD_INTERVAL)
 async def key_monitoring_loop():
-    """매매가 꺼져있을 때만 독립적으로 도는 키 모니터링 루프"""
-    if is_live_active: return # 매매 중일때는 live_trading_loop가 담당함
-    await update_key_embed()
-
-@tasks.loop(seconds=10)
-async def live_trading_loop():
-    """실전 매매 메인 루프"""
-    global is_live_active, live_wallet
-    if not is_live_active or not live_wallet: return
+    """키 모니터링 루프 (매매 여부와 무관하게 항상 독립 실행)"""
+    with loop_monitors['key']:
+        await update_key_embed()
 
-    try:
-        # [순서 1] 매매 임베드 업데이트
+@tasks.loop(seconds=DASHBOARD_INTERVAL)
+async def dashboard_loop():
+    """[NEW] 매매 현황 임베드 루프 (매매 루프와 분리되어 Discord 지연이 매매에 영향 없음)"""
+    if not is_live_active: return
+    with loop_monitors['dashboard']:
         await update_trading_embed()
+
+class LiveEngine:
+    """
+    [NEW] 심볼 1개의 실전 모의매매 엔진 (지갑 / 시세 스트림 / 지표 허브 / 캔들 마감 스케줄러)
+    - 심볼마다 독립적으로 판단/진입/청산하고, 거래소·AI 호출은 공용 제한(limiter)을 공유
+    """
+    def __init__(self, symbol, timeframe="5m"):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        # 캔들/지표/현재가 창구 (TTL 안에서는 대시보드와 매매 루프가 같은 스냅샷 공유)
+        self.hub = MarketDataHub(binance, symbol, timeframe, ttl=MARKET_DATA_TTL, limiter=exchange_limiter)
+        self.wallet = None
+        self.feed = None
+        self.scheduler = None
+        self.speculation = None # 마감 전 선행 판단 {'ts', 'row', 'task'}
+        self.entry_ms = None # [NEW] 마지막 진입 시각 (꼬리 백업 체크 기준)
+
+    @property
+    def active(self):
+        return is_live_active and self.wallet is not None
+
+    async def start(self):
+        self.wallet = FuturesWallet(initial_balance=LIVE_INITIAL_BALANCE, symbol=self.symbol, db=trade_db)
         
-        # [순서 2] 5초 대기 (요청 반영)
-        await asyncio.sleep(5)
+        # 시세 스트림 시작 (가격 갱신마다 SL/TP 체크)
+        self.feed = KlineStream(binance, self.symbol, self.timeframe, limiter=exchange_limiter)
+        self.feed.add_listener(self.check_exit)
+        await self.feed.start()
+        self.hub.attach(self.feed)
         
-        # [순서 3] 키 관리 임베드 업데이트
-        await update_key_embed()
+        # 진입 판단은 캔들 마감에 맞춰 실행
+        self.scheduler = CandleCloseScheduler(
+            self.timeframe, on_close=self.on_candle_close,
+            on_pre_close=self.on_pre_close if LIVE_SPECULATIVE_SECONDS > 0 else None,
+            pre_close=LIVE_SPECULATIVE_SECONDS
+        )
+        self.scheduler.start()
+
+    async def stop(self):
+        if self.scheduler:
+            await self.scheduler.stop()
+            self.scheduler = None
+        if self.speculation:
+            self.speculation['task'].cancel()
+            self.speculation = None
+        if self.feed:
+            self.hub.detach()
+            await self.feed.stop()
+            self.feed = None
+
+    def check_exit(self, price):
+        """시세 갱신마다 호출되는 SL/TP 체크 (스트림 콜백이므로 await 없이 즉시 처리)"""
+        if not self.active or not self.wallet.position: return
+        pos = self.wallet.position
+        sl_price, tp_price = pos['sl'], pos['tp']
+        close_reason = None
         
-        # --- 매매 로직 시작 ---
+        if pos['type'] == 'long':
+            if sl_price and price <= sl_price: close_reason = "Stop Loss 🔵"
+            elif tp_price and price >= tp_price: close_reason = "Take Profit 🔴"
+        elif pos['type'] == 'short':
+            if sl_price and price >= sl_price: close_reason = "Stop Loss 🔵"
+            elif tp_price and price <= tp_price: close_reason = "Take Profit 🔴"
+        
+        if close_reason:
+            trade_result = self.wallet.close_position(price, reason=close_reason)
+            run_in_background(announce_exit(self, close_reason, trade_result))
+
+    def check_wicks(self, df):
+        """
+        [NEW] 백업 체크: 진입 이후에 시작된 캔들의 고가/저가로 SL/TP 터치 확인
+        - 스트림이 끊긴 동안 틱으로 못 본 꼬리를 잡음 (체결가 = SL/TP 가격, 둘 다 닿았으면 SL 우선)
+        """
+        if not self.active or not self.wallet.position or self.entry_ms is None: return
+        after = df[df.index >= pd.to_datetime(self.entry_ms, unit='ms')]
+        if after.empty: return
+        pos = self.wallet.position
+        side = 1 if pos['type'] == 'long' else -1
+        bars = settlement.bar_arrays(after)
+        close = after['close'].to_numpy(dtype=float)
+        exit_idx, reason = settlement.find_exit(close, 0, side, pos['sl'], pos['tp'], bars=bars)
+        if exit_idx is None: return
+        
+        price = settlement.exit_price(close, bars, exit_idx, side, pos['sl'], pos['tp'], reason)
+        close_reason = "Stop Loss 🔵" if reason == "SL" else "Take Profit 🔴"
+        trade_result = self.wallet.close_position(price, reason=close_reason)
+        run_in_background(announce_exit(self, close_reason, trade_result))
+
+    async def tick(self):
+        """주기 작업: 지표 갱신 + SL/TP 백업 체크"""
         try:
-            ohlcv = await asyncio.to_thread(binance.fetch_ohlcv, "BTC/USDT", "5m", limit=200)
-            if not ohlcv: return
-            df_binance = pd.DataFrame(ohlcv, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-            df_binance['datetime'] = pd.to_datetime(df_binance['datetime'], unit='ms')
-            df_binance.set_index('datetime', inplace=True)
-            
-            df_binance = brain.calculate_indicators(df_binance)
-            if df_binance.empty: return
-            current_price = df_binance['close'].iloc[-1]
+            # 지표 프레임은 허브에서 공유 (증분 갱신 + TTL 캐시)
+            df = await self.hub.get_frame()
+            if df is None or df.empty: return
+            current_price = df['close'].iloc[-1]
         except Exception as e:
-            print(f"Data Fetch Error: {e}")
+            print(f"Data Fetch Error ({self.symbol}): {e}")
+            return
+        
+        # 스트림 리스너가 틱마다 체크하지만, 스트림이 끊긴 경우를 위해 루프에서도 한 번 더 체크
+        self.check_exit(current_price)
+        self.check_wicks(df)
+
+    def enter_from_decision(self, decision, current_price):
+        """AI 판단이 진입 조건을 만족하면 즉시 진입 (알림/임베드 갱신은 백그라운드)"""
+        if self.wallet.position is not None: return False
+        if decision['confidence'] < 70 or decision['decision'] not in ['long', 'short']: return False
+        side = decision['decision']
+        
+        balance = self.wallet.get_balance()
+        invest_amount = balance * 0.99 
+        
+        sl = decision.get('sl')
+        tp = decision.get('tp')
+        if not sl or sl == 0:
+            sl = current_price * 0.98 if side == 'long' else current_price * 1.02
+        if not tp or tp == 0:
+            tp = current_price * 1.04 if side == 'long' else current_price * 0.96
+
+        self.wallet.enter_position(side, current_price, invest_amount, sl=sl, tp=tp)
+        self.entry_ms = int(time.time() * 1000)
+        
+        # 번역/알림은 진입 이후 백그라운드에서 처리 (LLM 왕복 1회 절감)
+        run_in_background(announce_entry(self.symbol, side, decision['confidence'], current_price, decision.get('reason', 'No reason')))
+        
+        run_in_background(update_trading_embed()) # 진입 직후 갱신 (매매 경로는 기다리지 않음)
+        return True
+
+    async def closed_frame(self, candle_ts):
+        """candle_ts 캔들까지 잘라낸 지표 프레임 (마지막 행이 해당 캔들이 아니면 None)"""
+        df = await self.hub.get_frame(max_age=0)
+        if df is None or df.empty: return None
+        candle_time = pd.to_datetime(candle_ts, unit='ms')
+        df = df[df.index <= candle_time]
+        if df.empty or df.index[-1] != candle_time: return None
+        return df
+
+    async def on_pre_close(self, candle_ts):
+        """마감 직전 미완성 캔들로 미리 AI 질의 (결과는 마감 시 검증 후 채택)"""
+        if not self.active or self.wallet.position: return
+        df = await self.closed_frame(candle_ts)
+        if df is None: return
+        self.speculation = {'ts': candle_ts, 'row': df.iloc[-1], 'task': asyncio.create_task(ask_ai_decision(df, self.symbol, self.timeframe))}
+
+    async def on_candle_close(self, candle_ts):
+        """캔들 마감 직후 진입 판단 (선행 판단이 유효하면 재사용, 아니면 확정 캔들로 재질의)"""
+        spec, self.speculation = self.speculation, None
+        if not self.active or self.wallet.position:
+            if spec: spec['task'].cancel()
+            return
+        
+        df = await self.closed_frame(candle_ts)
+        if df is None:
+            if spec: spec['task'].cancel()
+            print(f"⚠️ 마감 캔들 데이터 없음 ({self.symbol}): {pd.to_datetime(candle_ts, unit='ms')}")
             return
+        
+        decision = None
+        if spec and spec['ts'] == candle_ts:
+            if speculation_holds(spec['row'], df.iloc[-1]):
+                decision = await spec['task']
+                speculation_stats['hit'] += 1
+            else:
+                spec['task'].cancel()
+                speculation_stats['miss'] += 1
+                print(f"🔁 선행 판단 폐기 ({self.symbol}, 확정 캔들 지표 변동) -> 재질의")
+        elif spec:
+            spec['task'].cancel()
+        if decision is None:
+            decision = await ask_ai_decision(df, self.symbol, self.timeframe)
+        
+        current_price = await self.hub.get_price(max_age=0) or df['close'].iloc[-1]
+        self.enter_from_decision(decision, current_price)
 
-        if live_wallet.position:
-            pos = live_wallet.position
-            sl_price, tp_price = pos['sl'], pos['tp']
-            close_reason = None
-            
-            if pos['type'] == 'long':
-                if sl_price and current_price <= sl_price: close_reason = "Stop Loss 🔵"
-                elif tp_price and current_price >= tp_price: close_reason = "Take Profit 🔴"
-            elif pos['type'] == 'short':
-                if sl_price and current_price >= sl_price: close_reason = "Stop Loss 🔵"
-                elif tp_price and current_price <= tp_price: close_reason = "Take Profit 🔴"
-            
-            if close_reason:
-                trade_result = live_wallet.close_position(current_price, reason=close_reason)
-                ch = bot.get_channel(EXPLAIN_ID)
-                if ch:
-                    pnl_krw = usdt_to_krw(trade_result['pnl'])
-                    color = 0x00ff00 if trade_result['pnl'] > 0 else 0xff0000
-                    embed = discord.Embed(title=f"⚡ 포지션 종료: {close_reason}", color=color)
-                    embed.add_field(name="수익금", value=f"${trade_result['pnl']:.2f} (≈{pnl_krw:,}원)", inline=True)
-                    embed.add_field(name="수익률", value=f"{trade_result['profit_rate']:.2f}%", inline=True)
-                    await ch.send(embed=embed)
-                    
-                    if trade_result['pnl'] < 0:
-                        feedback = await analyze_failure(trade_result, df_binance)
-                        await send_split_description_embed(ch, "😭 전문 트레이더의 팩트 폭격", feedback, 0x000000)
-
-        if live_wallet.position is None:
-            if 10 <= datetime.now().second <= 20: 
-                decision = await ask_ai_decision(df_binance)
-                
-                if decision['confidence'] >= 70 and decision['decision'] in ['long', 'short']:
-                    side = decision['decision']
-                    reason_kr = await translate_reason(decision.get('reason', 'No reason'))
-                    
-                    balance = live_wallet.get_balance()
-                    invest_amount = balance * 0.99 
-                    
-                    sl = decision.get('sl')
-                    tp = decision.get('tp')
-                    if not sl or sl == 0:
-                        sl = current_price * 0.98 if side == 'long' else current_price * 1.02
-                    if not tp or tp == 0:
-                        tp = current_price * 1.04 if side == 'long' else current_price * 0.96
-
-                    live_wallet.enter_position(side, current_price, invest_amount, sl=sl, tp=tp)
-                    
-                    ch = bot.get_channel(EXPLAIN_ID)
-                    if ch:
-                        embed = discord.Embed(title=f"🚀 AI 진입 신호: {side.upper()}", color=0x0000ff)
-                        embed.add_field(name="확신도", value=f"{decision['confidence']}%", inline=True)
-                        embed.add_field(name="진입가", value=f"${current_price:,.2f}", inline=True)
-                        await send_split_field_embed(ch, embed, "판단 이유", reason_kr)
-                    
-                    await update_trading_embed() # 진입 직후 갱신
-                    await asyncio.sleep(5) 
+live_engines = {symbol: LiveEngine(symbol, LIVE_TIMEFRAME) for symbol in LIVE_SYMBOLS} # [NEW] 심볼별 매매 엔진
 
-    except Exception as e:
-        print(f"🔥 Live Loop Error: {e}")
-        traceback.print_exc()
-        await asyncio.sleep(5)
+def speculation_holds(pre_row, final_row):
+    """선행 판단 시점 지표와 확정 캔들 지표가 허용 범위 안인지 (종가/RSI/거래량 비율)"""
+    if abs(final_row['close'] - pre_row['close']) > pre_row['close'] * LIVE_SPECULATIVE_TOLERANCE: return False
+    if abs(final_row['RSI'] - pre_row['RSI']) > 2.0: return False
+    return abs(final_row['vol_ratio'] - pre_row['vol_ratio']) <= 0.25
+
+async def announce_exit(engine, close_reason, trade_result):
+    """청산 알림 + 손실 시 실패 분석 (청산 경로 밖에서 실행)"""
+    ch = bot.get_channel(EXPLAIN_ID)
+    if not ch: return
+    pnl_krw = usdt_to_krw(trade_result['pnl'])
+    color = 0x00ff00 if trade_result['pnl'] > 0 else 0xff0000
+    embed = discord.Embed(title=f"⚡ 포지션 종료: {engine.symbol} {close_reason}", color=color)
+    embed.add_field(name="수익금", value=f"${trade_result['pnl']:.2f} (≈{pnl_krw:,}원)", inline=True)
+    embed.add_field(name="수익률", value=f"{trade_result['profit_rate']:.2f}%", inline=True)
+    await ch.send(embed=embed)
+    
+    df_context = await engine.hub.get_frame() if trade_result['pnl'] < 0 else None
+    if df_context is not None and not df_context.empty:
+        feedback = await analyze_failure(trade_result, df_context)
+        await send_split_description_embed(ch, "😭 전문 트레이더의 팩트 폭격", feedback, 0x000000)
+
+@tasks.loop(seconds=LIVE_TRADING_INTERVAL)
+async def live_trading_loop():
+    """실전 매매 메인 루프: 심볼별 지표 갱신 + SL/TP 백업 체크 (진입은 엔진별 스케줄러, 임베드는 별도 루프)"""
+    if not is_live_active: return
+    with loop_monitors['trading']:
+        await asyncio.gather(*(engine.tick() for engine in live_engines.values()))
 
 @bot.command(name="테스트매매시작")
 async def start_live_trading(ctx):
-    global is_live_active, live_wallet, dashboard_msg
+    global is_live_active, dashboard_msg
     if is_live_active:
         await ctx.send("⚠️ 이미 실행 중입니다.")
         return
     
-    # 매매 시작 시 키 모니터링 루프 중단 (live_trading_loop에서 통합 관리)
-    if key_monitoring_loop.is_running():
-        key_monitoring_loop.stop()
-
-    live_wallet = FuturesWallet(initial_balance=1000)
     is_live_active = True
     dashboard_msg = None 
     
-    await ctx.send("🚀 **Binance 실전 모의투자** 시작! (초기자금: 1,000 USDT)")
+    # [NEW] 심볼별 엔진 동시 시작 (지갑 생성 + 시세 스트림 + 캔들 마감 스케줄러)
+    await asyncio.gather(*(engine.start() for engine in live_engines.values()))
+    
+    symbols_text = ", ".join(live_engines)
+    await ctx.send(f"🚀 **Binance 실전 모의투자** 시작! ({symbols_text} / 심볼당 초기자금: {LIVE_INITIAL_BALANCE:,.0f} USDT)")
     live_trading_loop.start()
+    dashboard_loop.start()
 
 @bot.command(name="테스트매매종료")
 async def stop_live_trading(ctx):
     global is_live_active
     is_live_active = False
     live_trading_loop.stop()
+    dashboard_loop.stop()
+    await asyncio.gather(*(engine.stop() for engine in live_engines.values()))
     
-    # 매매 종료 시 키 모니터링 루프 재가동
-    if not key_monitoring_loop.is_running():
-        key_monitoring_loop.start()
-        
     await ctx.send("⏸️ 매매를 중지했습니다. (키 모니터링은 유지됩니다)")
 
 @bot.command(name="종료")
 async def shutdown(ctx):
     await ctx.send("🤖 봇을 종료합니다.")
+    await asyncio.to_thread(trade_db.close) # [NEW] 대기 중인 거래 기록을 모두 저장한 뒤 종료
+    backtest_db.close()
     await bot.close()
 
 @bot.command(name="백테스트")
@@ -575,6 +817,10 @@ async def start_backtest(ctx, arg1: str, arg2: str = None):
         embed.add_field(name="최종 자산", value=f"${int(result['final_balance']):,} (USDT)", inline=True)
         embed.add_field(name="수익률", value=f"{result['roi']:.2f}%", inline=True)
         embed.add_field(name="승률", value=f"{result['win_rate']:.1f}%", inline=True)
+        if 'cache_hits' in result:
+            embed.add_field(name="AI 캐시", value=f"적중 {result['cache_hits']} / 미스 {result['cache_misses']}", inline=True)
+        if result.get('run_id'):
+            embed.set_footer(text=f"Run ID: {result['run_id']} (`!백테스트비교 이전ID {result['run_id']}`로 비교)")
         
         logs = result.get('logs', [])
         if logs:
@@ -594,6 +840,87 @@ async def start_backtest(ctx, arg1: str, arg2: str = None):
     else:
         await ctx.send("❌ 백테스트 실패 (결과 없음)")
 
+@bot.command(name="백테스트기록")
+async def backtest_history(ctx, limit: int = 10):
+    """[NEW] 최근 백테스트 실행 목록"""
+    runs = backtest_db.list_runs(limit)
+    if not runs:
+        await ctx.send("📭 저장된 백테스트 기록이 없습니다.")
+        return
+    lines = []
+    for r in runs:
+        roi = f"{r['roi']:+.2f}%" if r['roi'] is not None else "-"
+        win = f"{r['win_rate']:.1f}%" if r['win_rate'] is not None else "-"
+        lines.append(f"#{r['run_id']} {r['executed_at']} | {r['target_days']:g}일 | ROI {roi} | 승률 {win} | {r['total_trades'] or 0}회 | {r['status']}")
+    await send_split_description_embed(ctx, "🗂️ 백테스트 기록", "\n".join(lines), 0x9b59b6)
+
+@bot.command(name="백테스트비교")
+async def backtest_compare(ctx, run_a: int, run_b: int):
+    """[NEW] 두 백테스트 실행 비교 (요약 지표 차이 + 판단이 달라진 캔들)"""
+    diff = backtest_db.diff_runs(run_a, run_b, sample=10)
+    if diff is None:
+        await ctx.send("❌ 해당 Run ID가 없습니다.")
+        return
+    s = diff['summary']
+    embed = discord.Embed(title=f"🆚 백테스트 비교 #{run_a} → #{run_b}", color=0x9b59b6)
+    embed.add_field(name="수익률 차이", value=f"{s['roi']:+.2f}%p", inline=True)
+    embed.add_field(name="승률 차이", value=f"{s['win_rate']:+.1f}%p", inline=True)
+    embed.add_field(name="매매 횟수 차이", value=f"{s['total_trades']:+d}회", inline=True)
+    embed.add_field(name="판단 변화", value=f"공통 캔들 {diff['common_decisions']}개 중 {diff['changed_decisions']}개 변경", inline=False)
+    if diff['changed_sample']:
+        sample = "\n".join(f"{c['timestamp']}: {c['decision_a']} → {c['decision_b']}" for c in diff['changed_sample'])
+        embed.add_field(name="변경 예시", value=f"```\n{sample}\n```", inline=False)
+    await ctx.send(embed=embed)
+
+@bot.command(name="재정산")
+async def resimulate_backtest(ctx, run_id: int, *params):
+    """[NEW] 저장된 AI 판단으로 정산만 다시 실행 (예: `!재정산 12 conf=80 fee=0.0002 size=0.5 sl=0.015`)"""
+    try:
+        sim_params = parse_sim_params(params)
+    except ValueError as e:
+        await ctx.send(f"❌ 파라미터 오류: {e}\n사용 가능: conf(확신도 기준), fee(수수료율), size(진입 비중), sl(SL 안전망 비율), sl_atr/tp_atr(ATR 배수)")
+        return
+    
+    started = time.perf_counter()
+    result = await asyncio.to_thread(backtester.resimulate, run_id, **sim_params)
+    if result is None:
+        await ctx.send(f"❌ Run ID {run_id} 기록(또는 캔들)이 없습니다.")
+        return
+    
+    params_text = ", ".join(f"{k}={v:g}" for k, v in sim_params.items()) or "기본 규칙"
+    params_text += f" · 정산: {'캔들 꼬리' if result['mode'] == 'intrabar' else '종가'}"
+    embed = discord.Embed(title=f"♻️ 재정산 결과 (Run #{run_id})", description=f"파라미터: {params_text}", color=0x9b59b6)
+    embed.add_field(name="수익률", value=f"{result['roi']:.2f}% (기존 {result['base_roi'] or 0:.2f}%)", inline=True)
+    embed.add_field(name="승률", value=f"{result['win_rate']:.1f}% (기존 {result['base_win_rate'] or 0:.1f}%)", inline=True)
+    embed.add_field(name="매매 횟수", value=f"{len(result['trades'])}회 (기존 {result['base_trades'] or 0}회)", inline=True)
+    embed.set_footer(text=f"AI 호출 없이 정산만 실행 · {time.perf_counter() - started:.2f}초")
+    await ctx.send(embed=embed)
+
+@bot.command(name="탐색결과")
+async def sweep_results(ctx, sweep_id: int = None):
+    """[NEW] 파라미터 탐색 순위표 조회 (탐색 실행은 CLI: python parallel_backtester.py sweep <run_id> ...)"""
+    if sweep_id is None:
+        sweeps = backtest_db.list_sweeps(limit=1)
+        if not sweeps:
+            await ctx.send("ℹ️ 저장된 파라미터 탐색이 없습니다.")
+            return
+        sweep_id = sweeps[0]['sweep_id']
+    sweep = backtest_db.get_sweep(sweep_id, limit=10)
+    if sweep is None:
+        await ctx.send(f"❌ Sweep #{sweep_id} 기록이 없습니다.")
+        return
+    
+    grid_text = ", ".join(f"{k}={'/'.join(f'{v:g}' for v in values)}" for k, values in sweep['grid'].items())
+    embed = discord.Embed(title=f"🧮 파라미터 탐색 #{sweep_id} (Run #{sweep['run_id']})",
+                          description=f"그리드: {grid_text or '기본 규칙'}\n{sweep['combinations']}조합 · {sweep['elapsed'] or 0:.2f}초",
+                          color=0x1abc9c)
+    for r in sweep['results']:
+        params_text = ", ".join(f"{k}={v:g}" for k, v in r['params'].items()) or "기본 규칙"
+        embed.add_field(name=f"{r['rank']}위 · ROI {r['roi']:+.2f}%",
+                        value=f"{params_text}\n승률 {r['win_rate']:.1f}% / {r['total_trades']}회", inline=False)
+    embed.set_footer(text=sweep['executed_at'])
+    await ctx.send(embed=embed)
+
 @bot.event
 async def on_ready():
     print(f"✅ {bot.user} 접속 성공! (Binance Mode)")
@@ -0,0 +1,399 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import aiohttp  # discord.py 설치 시 함께 설치됨
+
+import brain
+from candle_cache import timeframe_to_ms
+
+# ==========================================
+# 실시간 시세 피드 (웹소켓 kline/체결 스트림 + REST 폴백)
+# ==========================================
+# 캔들 형식은 ccxt fetch_ohlcv와 동일: [timestamp_ms, open, high, low, close, volume]
+# - 버퍼 마지막 캔들은 아직 닫히지 않은 진행 중 캔들일 수 있음 (REST 응답과 동일)
+# - 가격이 바뀔 때마다 등록된 리스너(동기 함수)를 호출 -> SL/TP를 틱 단위로 체크
+
+BINANCE_FUTURES_WS = "wss://fstream.binance.com/stream"
+
+async def run_rest(limiter, fn, *args, **kwargs):
+    """블로킹 REST 호출을 스레드에서 실행. limiter(asyncio.Semaphore)가 있으면 동시 호출 수 제한"""
+    if limiter is None:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    async with limiter:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+def stream_symbol(symbol):
+    """'BTC/USDT' 또는 'BTC/USDT:USDT' -> 'btcusdt'"""
+    return symbol.split(':')[0].replace('/', '').lower()
+
+class MarketFeed:
+    """롤링 캔들 버퍼 + 최신가 + 가격 리스너 (KlineStream/ReplayFeed 공통)"""
+    def __init__(self, symbol, timeframe, maxlen=500):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.candles = deque(maxlen=maxlen)
+        self.last_price = None
+        self.last_update = None  # time.monotonic() 기준
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """callback(price) - 가격 갱신마다 호출됨. 오래 걸리는 작업은 직접 백그라운드로 넘길 것"""
+        self.listeners.append(callback)
+
+    def _apply_candle(self, candle):
+        if self.candles and self.candles[-1][0] == candle[0]:
+            self.candles[-1] = candle  # 진행 중 캔들 갱신
+        elif not self.candles or candle[0] > self.candles[-1][0]:
+            self.candles.append(candle)
+        # 버퍼보다 과거 캔들은 무시 (REST 병합은 _merge에서 처리)
+
+    def _merge(self, rows):
+        """REST로 받은 캔들을 버퍼와 병합 (같은 타임스탬프는 새 값 우선)"""
+        merged = {c[0]: c for c in self.candles}
+        for r in rows:
+            merged[int(r[0])] = [int(r[0])] + [float(x) for x in r[1:6]]
+        self.candles = deque((merged[ts] for ts in sorted(merged)), maxlen=self.candles.maxlen)
+
+    def _set_price(self, price):
+        self.last_price = price
+        self.last_update = time.monotonic()
+        for callback in list(self.listeners):
+            try:
+                callback(price)
+            except Exception as e:
+                print(f"⚠️ 시세 리스너 오류: {e}")
+
+    def snapshot(self, limit):
+        """최근 limit개 캔들 복사본 (ccxt 형식 리스트)"""
+        rows = list(self.candles)[-limit:]
+        return [list(c) for c in rows]
+
+    @property
+    def is_fresh(self):
+        return self.last_update is not None
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def get_ohlcv(self, limit):
+        return self.snapshot(limit)
+
+    async def get_price(self):
+        return self.last_price
+
+class KlineStream(MarketFeed):
+    """
+    바이낸스 선물 kline + aggTrade 웹소켓 구독
+    - 연결이 끊겼거나 stale_after초 동안 메시지가 없으면 REST(fetch_ohlcv/fetch_ticker)로 폴백
+    - 끊겼다 다시 붙으면 REST로 빈 구간을 메움
+    """
+    def __init__(self, exchange, symbol="BTC/USDT", timeframe="5m", maxlen=500, stale_after=15, seed=200, limiter=None):
+        super().__init__(symbol, timeframe, maxlen=maxlen)
+        self.exchange = exchange
+        self.limiter = limiter  # 여러 심볼이 공유하는 REST 동시 호출 제한
+        self.stale_after = stale_after
+        self.seed = seed
+        self.connected = False
+        self.rest_calls = 0
+        self.reconnects = 0
+        self._task = None
+
+    @property
+    def url(self):
+        s = stream_symbol(self.symbol)
+        return f"{BINANCE_FUTURES_WS}?streams={s}@kline_{self.timeframe}/{s}@aggTrade"
+
+    @property
+    def is_fresh(self):
+        return (self.connected and self.last_update is not None
+                and time.monotonic() - self.last_update < self.stale_after)
+
+    async def start(self):
+        """REST로 초기 캔들을 채운 뒤 웹소켓 수신 시작"""
+        try:
+            await self._fetch_rest(self.seed)
+        except Exception as e:
+            print(f"⚠️ 초기 캔들 수집 실패 (웹소켓으로 계속): {e}")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.connected = False
+
+    async def _fetch_rest(self, limit):
+        ohlcv = await run_rest(self.limiter, self.exchange.fetch_ohlcv, self.symbol, self.timeframe, limit=limit)
+        self.rest_calls += 1
+        if ohlcv:
+            self._merge(ohlcv)
+        return ohlcv
+
+    async def _run(self):
+        delay = 1
+        while True:
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self.url, heartbeat=20) as ws:
+                        self.connected = True
+                        delay = 1
+                        print(f"📡 시세 스트림 연결: {self.symbol} {self.timeframe}")
+                        if self.reconnects:
+                            await self._fetch_rest(self.seed)  # 끊긴 동안 빈 캔들 보충
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self._handle(json.loads(msg.data))
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ 시세 스트림 오류: {e}")
+            finally:
+                self.connected = False
+            self.reconnects += 1
+            print(f"🔌 시세 스트림 끊김 - {delay}초 후 재연결 (REST 폴백 중)")
+            await asyncio.sleep(delay)
+            delay = min(60, delay * 2)
+
+    def _handle(self, payload):
+        data = payload.get('data', payload)
+        event = data.get('e')
+        if event == 'kline':
+            k = data['k']
+            candle = [int(k['t']), float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v'])]
+            self._apply_candle(candle)
+            self._set_price(candle[4])
+        elif event == 'aggTrade':
+            self._set_price(float(data['p']))
+
+    async def get_ohlcv(self, limit):
+        if not self.is_fresh or len(self.candles) < limit:
+            await self._fetch_rest(limit)
+        return self.snapshot(limit)
+
+    async def get_price(self):
+        if not self.is_fresh:
+            ticker = await run_rest(self.limiter, self.exchange.fetch_ticker, self.symbol)
+            self.rest_calls += 1
+            self._set_price(ticker['last'])
+        return self.last_price
+
+class ReplayFeed(MarketFeed):
+    """
+    저장된 캔들을 순서대로 재생하는 테스트용 피드 (네트워크 없음)
+    ohlcv: ccxt 형식 리스트 또는 CandleCache (N, 6) 배열
+    캔들마다 시가 -> 저가/고가 -> 종가 순서의 가격 경로를 흘려보냄
+    """
+    def __init__(self, ohlcv, symbol="BTC/USDT", timeframe="5m", warmup=200, maxlen=500):
+        super().__init__(symbol, timeframe, maxlen=maxlen)
+        self._rows = [[int(r[0])] + [float(x) for x in r[1:6]] for r in ohlcv]
+        self._pos = min(warmup, len(self._rows))
+        for row in self._rows[:self._pos]:
+            self._apply_candle(row)
+        if self._pos:
+            self.last_price = self._rows[self._pos - 1][4]
+            self.last_update = time.monotonic()
+
+    @property
+    def done(self):
+        return self._pos >= len(self._rows)
+
+    def step(self):
+        """다음 캔들 1개 재생. 더 없으면 False"""
+        if self.done: return False
+        ts, o, h, l, c, v = self._rows[self._pos]
+        self._pos += 1
+        path = (o, l, h, c) if c >= o else (o, h, l, c)  # 양봉은 저가 먼저, 음봉은 고가 먼저
+        candle = [ts, o, o, o, o, 0.0]
+        for price in path:
+            candle = [ts, o, max(candle[2], price), min(candle[3], price), price, 0.0]
+            self._apply_candle(candle)
+            self._set_price(price)
+        self._apply_candle([ts, o, h, l, c, v])
+        return True
+
+    async def run(self, interval=0.0):
+        """끝까지 재생 (interval초 간격)"""
+        while self.step():
+            await asyncio.sleep(interval)
+
+class MarketDataHub:
+    """
+    실시간 시장 데이터 단일 창구 (캔들 / 지표 프레임 / 현재가)
+    - ttl초 안의 재요청은 캐시된 스냅샷 반환, 동시에 들어온 같은 요청은 한 번만 조회
+    - 피드(KlineStream)가 붙어 있으면 피드에서, 없으면 거래소 REST로 직접 조회
+    - updated_at: 항목별 마지막 갱신 시각 (time.time 기준)
+    """
+    def __init__(self, exchange, symbol="BTC/USDT", timeframe="5m", ttl=3.0, seed=200, limiter=None):
+        self.exchange = exchange
+        self.limiter = limiter
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.ttl = ttl
+        self.seed = seed
+        self.feed = None
+        self.indicators = None  # brain.IndicatorState
+        self.updated_at = {}
+        self.hits = 0
+        self.fetches = 0
+        self._cache = {}    # name -> (monotonic, value)
+        self._pending = {}  # name -> 진행 중인 Task
+
+    def attach(self, feed):
+        self.feed = feed
+        self.reset()
+
+    def detach(self):
+        self.feed = None
+        self.reset()
+
+    def reset(self):
+        """지표 상태와 캐시 초기화 (매매 재시작 등)"""
+        self.indicators = None
+        self._cache.clear()
+
+    def age(self, name):
+        """해당 항목이 마지막으로 갱신된 뒤 지난 초 (없으면 None)"""
+        ts = self.updated_at.get(name)
+        return None if ts is None else time.time() - ts
+
+    async def _cached(self, name, loader, max_age=None):
+        max_age = self.ttl if max_age is None else max_age
+        entry = self._cache.get(name)
+        if entry and time.monotonic() - entry[0] < max_age:
+            self.hits += 1
+            return entry[1]
+        task = self._pending.get(name)
+        if task is None:
+            task = asyncio.create_task(self._load(name, loader))
+            self._pending[name] = task
+        # 먼저 요청한 쪽이 취소돼도 다른 대기자를 위해 조회는 계속 진행
+        return await asyncio.shield(task)
+
+    async def _load(self, name, loader):
+        try:
+            value = await loader()
+            self.fetches += 1
+            self._cache[name] = (time.monotonic(), value)
+            self.updated_at[name] = time.time()
+            return value
+        finally:
+            self._pending.pop(name, None)
+
+    async def _fetch_candles(self, limit):
+        if self.feed:
+            return await self.feed.get_ohlcv(limit)
+        return await run_rest(self.limiter, self.exchange.fetch_ohlcv, self.symbol, self.timeframe, limit=limit)
+
+    async def get_candles(self, limit=200, max_age=None):
+        return await self._cached(f"candles:{limit}", lambda: self._fetch_candles(limit), max_age)
+
+    async def _fetch_price(self):
+        if self.feed:
+            return await self.feed.get_price()
+        ticker = await run_rest(self.limiter, self.exchange.fetch_ticker, self.symbol)
+        return ticker['last']
+
+    async def get_price(self, max_age=None):
+        return await self._cached("price", self._fetch_price, max_age)
+
+    async def _build_frame(self):
+        # 최초 1회만 seed개로 상태를 만들고, 이후엔 최근 캔들만 받아 증분 갱신
+        if self.indicators is None or self.indicators.last_ts is None:
+            ohlcv = await self._fetch_candles(self.seed)
+            if not ohlcv: return None
+            self.indicators = brain.IndicatorState.from_ohlcv(ohlcv)
+        else:
+            ohlcv = await self._fetch_candles(3)
+            if not ohlcv: return None
+            if ohlcv[0][0] > self.indicators.last_ts + timeframe_to_ms(self.timeframe):
+                # 누락 구간 발생 시 전체 재구성
+                ohlcv = await self._fetch_candles(self.seed)
+                self.indicators = brain.IndicatorState.from_ohlcv(ohlcv)
+            else:
+                for candle in ohlcv:
+                    self.indicators.update(candle)
+        return self.indicators.to_frame()
+
+    async def get_frame(self, max_age=None):
+        """
+        지표가 계산된 캔들 DataFrame (calculate_indicators 결과와 같은 형태). 데이터 없으면 None
+        max_age: 이 값(초)보다 오래된 캐시는 쓰지 않음 (기본 ttl, 0이면 항상 새로 갱신)
+        """
+        return await self._cached("frame", self._build_frame, max_age)
+
+class CandleCloseScheduler:
+    """
+    캔들 마감 시각에 맞춰 콜백 실행 (벽시계 기준, 타임프레임 경계)
+    - on_close(candle_ts): 마감 settle초 뒤 호출. candle_ts = 방금 닫힌 캔들의 시작 시각(ms)
+    - on_pre_close(candle_ts): 마감 pre_close초 전에 호출 (None/0이면 사용 안 함)
+    콜백은 순서대로 await되므로, 오래 걸리는 작업은 콜백 안에서 태스크로 넘길 것
+    """
+    def __init__(self, timeframe, on_close, on_pre_close=None, pre_close=None, settle=1.0):
+        self.timeframe = timeframe
+        self.tf_ms = timeframe_to_ms(timeframe)
+        self.on_close = on_close
+        self.on_pre_close = on_pre_close
+        self.pre_close = pre_close
+        self.settle = settle
+        self.fired = 0
+        self._task = None
+
+    @staticmethod
+    def now_ms():
+        return int(time.time() * 1000)
+
+    def next_close(self, now_ms=None):
+        """now_ms 이후 처음 오는 캔들 마감 시각(ms)"""
+        now_ms = self.now_ms() if now_ms is None else now_ms
+        return (now_ms // self.tf_ms + 1) * self.tf_ms
+
+    async def _sleep_until(self, ts_ms):
+        delay = (ts_ms - self.now_ms()) / 1000
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _call(self, callback, candle_ts):
+        try:
+            await callback(candle_ts)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ 캔들 마감 콜백 오류 ({callback.__name__}): {e}")
+
+    async def _run(self):
+        while True:
+            close_ts = self.next_close()
+            candle_ts = close_ts - self.tf_ms
+            if self.on_pre_close and self.pre_close:
+                pre_ts = close_ts - int(self.pre_close * 1000)
+                if self.now_ms() < pre_ts:
+                    await self._sleep_until(pre_ts)
+                    await self._call(self.on_pre_close, candle_ts)
+            await self._sleep_until(close_ts + int(self.settle * 1000))
+            await self._call(self.on_close, candle_ts)
+            self.fired += 1
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,17 +1,41 @@
 import sqlite3
 import os
 import threading 
+import hashlib
+import json
+import time
+import queue
+import atexit
+from concurrent.futures import Future
 from datetime import datetime
 
 class TradeDB:
-    def __init__(self, db_name="trading_bot.db"):
+    """
+    [NEW] 거래 기록 DB (write-behind)
+    - log_trade는 큐에 넣고 즉시 반환 -> 이벤트 루프가 디스크 I/O(fsync)를 기다리지 않음
+    - 백그라운드 스레드가 쌓인 기록을 모아 한 트랜잭션으로 저장 (WAL 모드)
+    - 종료 시 close()가 남은 기록을 모두 쓰고 닫음 (atexit에도 등록)
+    """
+    _STOP = object()
+
+    def __init__(self, db_name="trading_bot.db", batch_size=100):
         self.conn = sqlite3.connect(db_name, check_same_thread=False)
         self.lock = threading.Lock()
+        self.batch_size = batch_size
         self.create_tables()
+        
+        self.queue = queue.Queue()
+        self.closed = False
+        self._queue_lock = threading.Lock()  # 종료 표식 뒤에 기록이 끼어들지 않도록 (디스크 I/O와는 무관한 짧은 락)
+        self.writer = threading.Thread(target=self._writer_loop, name="TradeDB-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
 
     def create_tables(self):
         with self.lock:
             cursor = self.conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS trades (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -28,28 +52,99 @@ class TradeDB:
                     ai_analysis TEXT
                 )
             ''')
+            # [NEW] 멀티 심볼 매매용 symbol 컬럼 (기존 DB는 컬럼 추가로 마이그레이션)
+            cursor.execute("PRAGMA table_info(trades)")
+            if 'symbol' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE trades ADD COLUMN symbol TEXT")
             self.conn.commit()
 
     def log_trade(self, trade_data):
+        """
+        거래 기록을 저장 큐에 넣음. 반환: 저장 후 거래 id가 채워지는 Future
+        (동기 코드는 .result(), asyncio 코드는 await asyncio.wrap_future(f)로 대기)
+        """
+        row = (
+            trade_data.get('symbol'), trade_data['side'], trade_data['entry'], trade_data['exit'], trade_data['amount'],
+            trade_data['pnl'], trade_data['profit_rate'], trade_data['fee'], trade_data['reason'],
+            trade_data['entry_time'], trade_data['exit_time']
+        )
+        future = Future()
+        with self._queue_lock:
+            if not self.closed:
+                self.queue.put((row, future))
+                return future
+        self._write_batch([(row, future)])  # 종료 이후 들어온 기록은 직접 저장
+        return future
+
+    def _writer_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is self._STOP: break
+            batch = [item]
+            stop = False
+            # 이미 쌓여 있는 기록을 모아서 한 번에 커밋
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+            if stop: break
+
+    def _write_batch(self, batch):
+        rows = [(row, future) for row, future in batch if row is not None]
+        ids = []
         with self.lock:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                INSERT INTO trades (side, entry_price, exit_price, amount, pnl, profit_rate, fee, reason, entry_time, exit_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                trade_data['side'], trade_data['entry'], trade_data['exit'], trade_data['amount'],
-                trade_data['pnl'], trade_data['profit_rate'], trade_data['fee'], trade_data['reason'],
-                trade_data['entry_time'], trade_data['exit_time']
-            ))
-            self.conn.commit()
-            return cursor.lastrowid 
+            try:
+                cursor = self.conn.cursor()
+                for row, _ in rows:
+                    cursor.execute('''
+                        INSERT INTO trades (symbol, side, entry_price, exit_price, amount, pnl, profit_rate, fee, reason, entry_time, exit_time)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', row)
+                    ids.append(cursor.lastrowid)
+                if rows:
+                    self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                print(f"❌ 거래 기록 저장 실패 ({len(rows)}건): {e}")
+                for _, future in rows:
+                    future.set_exception(e)
+                ids = None
+        if ids is not None:
+            for (_, future), trade_id in zip(rows, ids):
+                future.set_result(trade_id)
+        # row가 None인 항목은 flush 표식 (앞선 기록이 모두 저장됐음을 알림)
+        for row, future in batch:
+            if row is None: future.set_result(None)
+
+    def flush(self, timeout=None):
+        """지금까지 넣은 기록이 모두 저장될 때까지 대기"""
+        if self.closed or not self.writer.is_alive(): return
+        marker = Future()
+        self.queue.put((None, marker))
+        marker.result(timeout)
+
+    def close(self):
+        """남은 기록을 모두 저장하고 writer 스레드 종료"""
+        with self._queue_lock:
+            if self.closed: return
+            self.closed = True
+            self.queue.put(self._STOP)
+        self.writer.join()
+        print("💾 거래 기록 저장 완료 (TradeDB 종료)")
 
 class FuturesWallet:
-    def __init__(self, initial_balance=10000000):
+    def __init__(self, initial_balance=10000000, symbol=None, db=None):
         self.initial_balance = initial_balance 
         self.balance = initial_balance
         self.position = None 
-        self.db = TradeDB() 
+        self.symbol = symbol # [NEW] 멀티 심볼 매매 시 거래 기록 구분용
+        self.db = db or TradeDB() # [NEW] 여러 지갑이 DB 연결 하나를 공유할 수 있음
         self.last_trade_id = None
 
     def get_balance(self):
@@ -110,6 +205,7 @@ class FuturesWallet:
 
         result = {
             "status": "closed",
+            "symbol": self.symbol,
             "side": side,
             "entry": entry,
             "exit": exit_price,
@@ -121,7 +217,7 @@ class FuturesWallet:
             "entry_time": pos['entry_time'],
             "exit_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
-        self.last_trade_id = self.db.log_trade(result)
+        self.last_trade_id = self.db.log_trade(result) # [NEW] 거래 id Future (저장은 백그라운드)
         self.position = None
         return result
 
@@ -131,12 +227,14 @@ class FuturesWallet:
 class BacktestDB:
     def __init__(self, db_name="backtest_results.db"):
         self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
         self.lock = threading.Lock()
         self.create_tables()
 
     def create_tables(self):
         with self.lock:
             cursor = self.conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
             
             # 1. 백테스트 실행 기록 (Runs)
             cursor.execute('''
@@ -151,6 +249,15 @@ class BacktestDB:
                     total_trades INTEGER
                 )
             ''')
+            # [NEW] 진행 상태 (running / done / failed) - 스트리밍 저장 중 중단된 실행 구분용
+            # [NEW] 심볼/타임프레임/캔들 구간 - 저장된 판단으로 재정산할 때 같은 캔들을 다시 불러오기 위함
+            # [NEW] settlement: 저장된 ROI를 만든 정산 규칙 ('intrabar' = 캔들 꼬리, 'close' / NULL = 종가만 - 예전 실행)
+            cursor.execute("PRAGMA table_info(runs)")
+            columns = {row[1] for row in cursor.fetchall()}
+            for name, decl in (("status", "TEXT DEFAULT 'done'"), ("symbol", "TEXT"), ("timeframe", "TEXT"),
+                               ("start_time", "TEXT"), ("end_time", "TEXT"), ("settlement", "TEXT")):
+                if name not in columns:
+                    cursor.execute(f"ALTER TABLE runs ADD COLUMN {name} {decl}")
             
             # 2. AI 판단 전수 기록 (Decisions)
             cursor.execute('''
@@ -178,63 +285,364 @@ class BacktestDB:
                     FOREIGN KEY(run_id) REFERENCES runs(run_id)
                 )
             ''')
+            
+            # [NEW] 실행별 조회/비교용 인덱스
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_decisions_run_ts ON decisions(run_id, timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_trades_run_time ON trades(run_id, trade_time)")
+            
+            # 4. [NEW] 정산 파라미터 탐색 (Sweeps) + 조합별 순위표
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sweeps (
+                    sweep_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id INTEGER,
+                    executed_at TEXT,
+                    grid TEXT,
+                    combinations INTEGER,
+                    elapsed REAL,
+                    FOREIGN KEY(run_id) REFERENCES runs(run_id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sweep_results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sweep_id INTEGER,
+                    rank INTEGER,
+                    params TEXT,
+                    final_balance REAL,
+                    roi REAL,
+                    win_rate REAL,
+                    total_trades INTEGER,
+                    FOREIGN KEY(sweep_id) REFERENCES sweeps(sweep_id)
+                )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_sweep_results_rank ON sweep_results(sweep_id, rank)")
             self.conn.commit()
 
-    def save_results(self, summary, ai_results, trades):
-        """백테스트 결과 전체를 저장"""
+    # ------------------------------------------
+    # [NEW] 스트리밍 저장 (실행 중에 판단/체결을 묶음 단위로 기록)
+    # ------------------------------------------
+    def start_run(self, days, initial_balance, symbol=None, timeframe=None, start_time=None, end_time=None, settlement=None):
+        """실행 기록을 running 상태로 먼저 만들고 run_id 반환"""
         with self.lock:
             cursor = self.conn.cursor()
-            
-            # (1) 실행 기록 저장
             cursor.execute('''
-                INSERT INTO runs (executed_at, target_days, initial_balance, final_balance, roi, win_rate, total_trades)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO runs (executed_at, target_days, initial_balance, status, symbol, timeframe, start_time, end_time, settlement)
+                VALUES (?, ?, ?, 'running', ?, ?, ?, ?, ?)
             ''', (
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                summary.get('days', 0),
-                summary['initial_balance'],
-                summary['final_balance'],
-                summary['roi'],
-                summary['win_rate'],
-                len(trades)
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"), days, initial_balance,
+                symbol, timeframe, None if start_time is None else str(start_time), None if end_time is None else str(end_time),
+                settlement
             ))
-            run_id = cursor.lastrowid
-            
-            # (2) AI 판단 모두 저장 (Bulk Insert)
-            # ai_results는 {timestamp: {json}} 형태
-            decision_data = []
-            for ts, res in ai_results.items():
-                decision_data.append((
-                    run_id,
-                    str(ts), # Timestamp -> String
-                    res.get('decision', 'hold'),
-                    res.get('confidence', 0),
-                    res.get('sl', 0),
-                    res.get('tp', 0)
-                ))
-            
-            if decision_data:
-                cursor.executemany('''
-                    INSERT INTO decisions (run_id, timestamp, decision, confidence, sl, tp)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', decision_data)
-                
-            # (3) 체결 내역 저장
-            trade_data = []
-            for t in trades:
-                trade_data.append((
-                    run_id,
-                    str(t['time']),
-                    t['roi'],
-                    t['pnl'],
-                    t['reason']
-                ))
-            
-            if trade_data:
-                cursor.executemany('''
-                    INSERT INTO trades (run_id, trade_time, roi, pnl, reason)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', trade_data)
-                
             self.conn.commit()
-            return run_id
+            return cursor.lastrowid
+
+    def add_decisions(self, run_id, ai_results):
+        """{timestamp: 응답} 묶음을 한 트랜잭션으로 저장"""
+        decision_data = [
+            (run_id, str(ts), res.get('decision', 'hold'), res.get('confidence', 0), res.get('sl', 0), res.get('tp', 0))
+            for ts, res in ai_results.items()
+        ]
+        if not decision_data: return
+        with self.lock:
+            self.conn.executemany('''
+                INSERT INTO decisions (run_id, timestamp, decision, confidence, sl, tp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', decision_data)
+            self.conn.commit()
+
+    def add_trades(self, run_id, trades):
+        trade_data = [(run_id, str(t['time']), t['roi'], t['pnl'], t['reason']) for t in trades]
+        if not trade_data: return
+        with self.lock:
+            self.conn.executemany('''
+                INSERT INTO trades (run_id, trade_time, roi, pnl, reason)
+                VALUES (?, ?, ?, ?, ?)
+            ''', trade_data)
+            self.conn.commit()
+
+    def finish_run(self, run_id, summary, total_trades, status='done', end_time=None):
+        """요약 기록 + 상태 변경. end_time: 실행 시작 시점에 몰랐던 마지막 캔들 시각 (compact 모드)"""
+        with self.lock:
+            self.conn.execute('''
+                UPDATE runs SET final_balance = ?, roi = ?, win_rate = ?, total_trades = ?, status = ?,
+                                end_time = COALESCE(?, end_time)
+                WHERE run_id = ?
+            ''', (summary.get('final_balance'), summary.get('roi'), summary.get('win_rate'), total_trades, status,
+                  None if end_time is None else str(end_time), run_id))
+            self.conn.commit()
+
+    def open_run(self, days, initial_balance, batch_size=500, **run_info):
+        """실행 중 판단/체결을 batch_size개씩 모아 저장하는 RunRecorder 반환 (run_info: symbol, timeframe, start_time, end_time, settlement)"""
+        return RunRecorder(self, self.start_run(days, initial_balance, **run_info), batch_size)
+
+    def save_sweep(self, run_id, grid, ranked, elapsed=None):
+        """[NEW] 파라미터 탐색 결과(ROI 순으로 정렬된 목록)를 순위표로 저장하고 sweep_id 반환"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO sweeps (run_id, executed_at, grid, combinations, elapsed) VALUES (?, ?, ?, ?, ?)
+            ''', (run_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), json.dumps(grid), len(ranked), elapsed))
+            sweep_id = cursor.lastrowid
+            cursor.executemany('''
+                INSERT INTO sweep_results (sweep_id, rank, params, final_balance, roi, win_rate, total_trades)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (sweep_id, rank, json.dumps(r['params']), r['final_balance'], r['roi'], r['win_rate'], r['total_trades'])
+                for rank, r in enumerate(ranked, start=1)
+            ])
+            self.conn.commit()
+            return sweep_id
+
+    def save_results(self, summary, ai_results, trades):
+        """백테스트 결과 전체를 한 번에 저장 (기존 호환용)"""
+        run_id = self.start_run(summary.get('days', 0), summary['initial_balance'])
+        self.add_decisions(run_id, ai_results)
+        self.add_trades(run_id, trades)
+        self.finish_run(run_id, summary, len(trades))
+        return run_id
+
+    # ------------------------------------------
+    # [NEW] 조회 API
+    # ------------------------------------------
+    def _fetchall(self, sql, params=()):
+        """[NEW] 조회도 쓰기와 같은 lock 안에서 (연결 1개를 여러 스레드가 공유)"""
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _fetchone(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def list_runs(self, limit=20):
+        """최근 실행 목록 (최신순)"""
+        rows = self._fetchall('''
+            SELECT run_id, executed_at, target_days, initial_balance, final_balance, roi, win_rate, total_trades, status
+            FROM runs ORDER BY run_id DESC LIMIT ?
+        ''', (limit,))
+        return [dict(r) for r in rows]
+
+    def list_sweeps(self, limit=20):
+        """[NEW] 최근 파라미터 탐색 목록 (최신순)"""
+        rows = self._fetchall('''
+            SELECT sweep_id, run_id, executed_at, grid, combinations, elapsed FROM sweeps ORDER BY sweep_id DESC LIMIT ?
+        ''', (limit,))
+        return [dict(r) for r in rows]
+
+    def get_sweep(self, sweep_id, limit=10):
+        """[NEW] 탐색 정보 + 상위 limit개 조합 (순위순). 없으면 None"""
+        row = self._fetchone("SELECT * FROM sweeps WHERE sweep_id = ?", (sweep_id,))
+        if row is None: return None
+        sweep = dict(row)
+        sweep['grid'] = json.loads(sweep['grid'])
+        rows = self._fetchall('''
+            SELECT rank, params, final_balance, roi, win_rate, total_trades
+            FROM sweep_results WHERE sweep_id = ? ORDER BY rank LIMIT ?
+        ''', (sweep_id, limit))
+        sweep['results'] = [dict(r, params=json.loads(r['params'])) for r in rows]
+        return sweep
+
+    def get_run(self, run_id):
+        row = self._fetchone("SELECT * FROM runs WHERE run_id = ?", (run_id,))
+        return dict(row) if row else None
+
+    def load_decisions(self, run_id):
+        """저장된 AI 판단 {timestamp 문자열: {'decision', 'confidence', 'sl', 'tp'}}"""
+        rows = self._fetchall('''
+            SELECT timestamp, decision, confidence, sl, tp FROM decisions WHERE run_id = ? ORDER BY timestamp
+        ''', (run_id,))
+        return {r['timestamp']: {'decision': r['decision'], 'confidence': r['confidence'], 'sl': r['sl'], 'tp': r['tp']} for r in rows}
+
+    def decision_range(self, run_id):
+        """판단이 저장된 첫/마지막 캔들 시각 (구간 정보가 없는 예전 실행용)"""
+        row = self._fetchone("SELECT MIN(timestamp), MAX(timestamp) FROM decisions WHERE run_id = ?", (run_id,))
+        return row[0], row[1]
+
+    def equity_curve(self, run_id):
+        """체결 순서대로 누적 잔고 [{'time', 'pnl', 'equity'}, ...]"""
+        run = self.get_run(run_id)
+        if run is None: return []
+        rows = self._fetchall('''
+            SELECT trade_time, pnl, SUM(pnl) OVER (ORDER BY trade_time, id) AS cum_pnl
+            FROM trades WHERE run_id = ? ORDER BY trade_time, id
+        ''', (run_id,))
+        initial = run['initial_balance'] or 0
+        return [{'time': r['trade_time'], 'pnl': r['pnl'], 'equity': initial + r['cum_pnl']} for r in rows]
+
+    def decision_distribution(self, run_id, min_confidence=70):
+        """판단별 개수 / 평균 확신도 / 진입 기준(min_confidence) 이상 개수"""
+        rows = self._fetchall('''
+            SELECT decision, COUNT(*) AS count, AVG(confidence) AS avg_confidence,
+                   SUM(CASE WHEN confidence >= ? THEN 1 ELSE 0 END) AS confident
+            FROM decisions WHERE run_id = ? GROUP BY decision ORDER BY count DESC
+        ''', (min_confidence, run_id))
+        return {r['decision']: {'count': r['count'], 'avg_confidence': r['avg_confidence'], 'confident': r['confident']} for r in rows}
+
+    def diff_runs(self, run_a, run_b, sample=20):
+        """
+        두 실행 비교: 요약 지표 차이(b - a) + 같은 캔들에서 판단이 달라진 개수/예시
+        """
+        a, b = self.get_run(run_a), self.get_run(run_b)
+        if a is None or b is None: return None
+        summary = {
+            key: (b[key] or 0) - (a[key] or 0)
+            for key in ('final_balance', 'roi', 'win_rate', 'total_trades')
+        }
+        counts = self._fetchone('''
+            SELECT COUNT(*) AS common,
+                   SUM(CASE WHEN da.decision != db.decision THEN 1 ELSE 0 END) AS changed
+            FROM decisions da JOIN decisions db ON db.run_id = ? AND db.timestamp = da.timestamp
+            WHERE da.run_id = ?
+        ''', (run_b, run_a))
+        changed = self._fetchall('''
+            SELECT da.timestamp, da.decision AS decision_a, da.confidence AS confidence_a,
+                   db.decision AS decision_b, db.confidence AS confidence_b
+            FROM decisions da JOIN decisions db ON db.run_id = ? AND db.timestamp = da.timestamp
+            WHERE da.run_id = ? AND da.decision != db.decision
+            ORDER BY da.timestamp LIMIT ?
+        ''', (run_b, run_a, sample))
+        return {
+            'run_a': a, 'run_b': b, 'summary': summary,
+            'common_decisions': counts['common'], 'changed_decisions': counts['changed'] or 0,
+            'changed_sample': [dict(r) for r in changed]
+        }
+
+class RunRecorder:
+    """[NEW] 백테스트 1회 실행의 판단/체결을 모아 두었다가 batch_size개마다 저장"""
+    def __init__(self, db, run_id, batch_size=500):
+        self.db = db
+        self.run_id = run_id
+        self.batch_size = batch_size
+        self.pending = {}
+        self.saved = 0
+        self.trades_saved = 0  # [NEW] add_trades로 미리 저장한 체결 수
+
+    def add_decisions(self, ai_results):
+        self.pending.update(ai_results)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending: return
+        self.db.add_decisions(self.run_id, self.pending)
+        self.saved += len(self.pending)
+        self.pending = {}
+
+    def add_trades(self, trades):
+        """[NEW] 체결을 실행 도중에 바로 저장 (compact 모드: 창마다 호출)"""
+        self.db.add_trades(self.run_id, trades)
+        self.trades_saved += len(trades)
+
+    def finish(self, summary, trades, status='done', end_time=None):
+        self.flush()
+        self.db.add_trades(self.run_id, trades)
+        self.db.finish_run(self.run_id, summary, self.trades_saved + len(trades), status, end_time)
+        return self.run_id
+
+# ==========================================
+# [NEW] AI 판단 캐시 (동일 프롬프트 재질의 방지)
+# ==========================================
+class DecisionCache:
+    """
+    (모델명, 프롬프트 템플릿 버전, 포맷된 지표 데이터) -> AI 응답 JSON 캐시
+    - TTL이 지난 항목은 조회되지 않으며, 용량 초과 시 가장 오래 안 쓴 항목부터 삭제 (LRU)
+    """
+    def __init__(self, db_name="ai_decision_cache.db", ttl_days=30, max_entries=200000):
+        self.conn = sqlite3.connect(db_name, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+        self.create_tables()
+
+    def create_tables(self):
+        with self.lock:
+            cursor = self.conn.cursor()
+            # [NEW] WAL: 조회(last_used 갱신) 커밋마다 fsync 대기하지 않도록
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS decision_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    prompt_version TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    last_used REAL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_decision_cache_last_used ON decision_cache(last_used)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_decision_cache_created_at ON decision_cache(created_at)')
+            self.conn.commit()
+
+    @staticmethod
+    def make_key(model, prompt_version, data_str):
+        raw = f"{model}\x1f{prompt_version}\x1f{data_str}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, model, prompt_version, data_str):
+        """캐시된 응답(dict) 또는 None"""
+        return self.get_many(model, prompt_version, [data_str])[0]
+
+    def get_many(self, model, prompt_version, data_strs, chunk=500):
+        """
+        [NEW] 여러 데이터를 한 번에 조회 -> data_strs 순서대로 응답(dict) 또는 None
+        - chunk개씩 SELECT ... IN (...) 한 번, 적중 항목 last_used 갱신은 한 트랜잭션으로 커밋
+        """
+        keys = [self.make_key(model, prompt_version, d) for d in data_strs]
+        now = time.time()
+        found = {}
+        with self.lock:
+            cursor = self.conn.cursor()
+            for i in range(0, len(keys), chunk):
+                part = list(set(keys[i:i + chunk]))
+                cursor.execute(
+                    f"SELECT cache_key, response, created_at FROM decision_cache WHERE cache_key IN ({','.join('?' * len(part))})",
+                    part
+                )
+                found.update((key, response) for key, response, created_at in cursor.fetchall() if now - created_at <= self.ttl)
+            if found:
+                cursor.executemany('UPDATE decision_cache SET last_used = ? WHERE cache_key = ?', [(now, key) for key in found])
+                self.conn.commit()
+            results = [json.loads(found[key]) if key in found else None for key in keys]
+            hits = sum(r is not None for r in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put(self, model, prompt_version, data_str, response):
+        key = self.make_key(model, prompt_version, data_str)
+        now = time.time()
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO decision_cache (cache_key, model, prompt_version, response, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key, model, prompt_version, json.dumps(response, ensure_ascii=False), now, now))
+            self.conn.commit()
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= 500:
+                self._evict(now)
+
+    def _evict(self, now):
+        """TTL 만료 삭제 + 용량 초과분 LRU 삭제 (lock 보유 상태에서 호출)"""
+        self._puts_since_evict = 0
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM decision_cache WHERE created_at < ?', (now - self.ttl,))
+        cursor.execute('SELECT COUNT(*) FROM decision_cache')
+        overflow = cursor.fetchone()[0] - self.max_entries
+        if overflow > 0:
+            cursor.execute('''
+                DELETE FROM decision_cache WHERE cache_key IN (
+                    SELECT cache_key FROM decision_cache ORDER BY last_used LIMIT ?
+                )
+            ''', (overflow,))
+        self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -1,114 +1,301 @@
 import ccxt
 import pandas as pd
-import google.generativeai as genai
+import numpy as np
 import json
 import time
+import asyncio
+import argparse
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
 from datetime import datetime, timedelta
 import brain  # 지표 계산용
-from paper_exchange import BacktestDB 
+import settlement  # 정산 엔진
+from paper_exchange import BacktestDB, DecisionCache 
+from candle_cache import CandleCache, timeframe_to_ms, can_resample
+from gemini_pool import GeminiClientPool, is_quota_error
+from rate_limit import RateLimiter
+import param_sweep  # [NEW] 정산 파라미터 그리드 탐색
+from intrabar import IntrabarResolver, can_drill  # [NEW] SL/TP 동시 터치 캔들 하위 캔들 판정
+
+MODEL_NAME = 'gemini-2.5-flash'
+# 프롬프트 문구를 바꾸면 버전을 올려야 이전 캐시 응답이 재사용되지 않음
+PROMPT_VERSION = "backtest-v1"
+BATCH_PROMPT_VERSION = "backtest-batch-v1"
+RESULTS_DB = "backtest_results.db"
+
+# [NEW] 재정산 파라미터 별칭 (디스코드 명령 `conf=80 fee=0.0002` 형태 입력용)
+SIM_PARAM_ALIASES = {'conf': 'conf_threshold', 'fee': 'fee_rate', 'size': 'size_frac', 'sl': 'sl_fallback'}
+ATR_WARMUP = 20  # [NEW] 재정산 시 ATR(14) 계산용으로 구간 앞에 더 읽는 캔들 수
+COMPACT_LOG_TAIL = 200  # [NEW] compact 모드에서 결과로 돌려줄 최근 로그 줄 수
+DOWNLOAD_CONCURRENCY = 4  # [NEW] 과거 캔들 동시 다운로드 창 수
+DOWNLOAD_RPM = 120  # [NEW] 캔들 다운로드 공용 분당 요청 한도 (klines limit 1500 = weight 10, IP 한도 2400/분)
+DOWNLOAD_RETRIES = 4  # [NEW] 창별 최대 시도 횟수
+CONTEXT_WARMUP = 50  # [NEW] 상위 타임프레임 지표 계산용으로 구간 앞에 더 읽는 상위 캔들 수
+CONTEXT_COLUMNS = ['close', 'EMA50', 'EMA200', 'RSI', 'MACD', 'MACD_Signal', 'ATR']  # 프롬프트에 붙일 상위 타임프레임 지표
+TIMEFRAME_WORDS = {'m': 'minute', 'h': 'hour', 'd': 'day', 'w': 'week'}
+SETTLEMENT_MODES = ('close', 'intrabar')  # [NEW] 실행 기록에 남기는 정산 규칙 (종가 / 캔들 꼬리)
+
+def timeframe_label(timeframe):
+    """'5m' -> '5-minute' (프롬프트 문구용)"""
+    return f"{timeframe[:-1]}-{TIMEFRAME_WORDS[timeframe[-1]]}"
+
+def parse_sim_params(tokens):
+    """['conf=80', 'fee=0.0002'] -> {'conf_threshold': 80.0, 'fee_rate': 0.0002}. 잘못된 입력은 ValueError"""
+    params = {}
+    for token in tokens:
+        if '=' not in token:
+            raise ValueError(f"'{token}' (key=value 형식이어야 함)")
+        key, value = token.split('=', 1)
+        key = SIM_PARAM_ALIASES.get(key.strip(), key.strip())
+        if key not in settlement.SIM_PARAMS:
+            raise ValueError(f"알 수 없는 파라미터 '{key}'")
+        params[key] = float(value)
+    return params
 
 class Backtester:
-    def __init__(self, api_keys, initial_balance=10000000):
-        self.api_keys = api_keys
+    def __init__(self, key_manager, initial_balance=10000000, lazy_eval=False, batch_size=1, decision_cache=None,
+                 client_pool=None, compact_window=0, timeframe="5m", base_timeframe="5m", context_timeframes=(),
+                 intrabar=True, drill_timeframe="1m"):
+        self.key_manager = key_manager  # 키별 RPM/RPD, 429 정지, 지연시간 추적 (실전 루프와 동일한 스케줄러)
         self.initial_balance = initial_balance
+        self.lazy_eval = lazy_eval  # True: 포지션 없는 캔들만 AI 질의
+        self.batch_size = max(1, int(batch_size))  # [NEW] 요청 1회에 담을 캔들 수
+        self.compact_window = max(0, int(compact_window))  # [NEW] >0: 이 캔들 수 단위 창으로 흘려 처리 (compact 모드)
+        self.max_key_wait = 300  # 이보다 오래 기다려야 하는 키(일일 한도 정지 등)는 이번 실행에서 제외
+        self.strikes = {}  # 키별 연속 실패 횟수 (실행 단위)
+        self.max_attempts = 3  # 캔들(묶음)별 최대 시도 횟수
+        self.max_strikes = 5  # 키가 연속으로 이만큼 실패하면 해당 워커 중단
+        self.decision_cache = decision_cache if decision_cache is not None else DecisionCache()
+        self.cache_stats = {'hits': 0, 'misses': 0}  # 이번 실행의 캐시 적중/미스 (공유 캐시의 전체 통계에는 실전 조회도 섞임)
+        self.client_pool = client_pool if client_pool is not None else GeminiClientPool(MODEL_NAME)
         # 바이낸스 퍼블릭 API
-        self.exchange = ccxt.binanceusdm({
-            'enableRateLimit': True,
-            'options': {'defaultType': 'future'}
-        })
+        self.exchange = self.make_exchange()
+        self._download_local = threading.local()  # [NEW] 다운로드 스레드별 ccxt 인스턴스
+        self.candle_cache = CandleCache()
+        self.download_limiter = RateLimiter(DOWNLOAD_RPM)  # [NEW] 다운로드 스레드 공용 속도 제한
+        self.result_sink = None  # [NEW] 응답이 도착하는 대로 호출 (판단 배열 채우기 + DB 스트리밍 저장)
+        self.symbol = "BTC/USDT"
+        self.timeframe = timeframe  # [NEW] 판단/정산 타임프레임
+        self.base_timeframe = base_timeframe  # [NEW] 실제로 다운로드/캐시하는 타임프레임 (상위 타임프레임은 여기서 리샘플링)
+        self.context_timeframes = list(context_timeframes)  # [NEW] 프롬프트에 함께 넣을 상위 타임프레임 (예: ['1h', '4h'])
+        self.intrabar = intrabar  # [NEW] True: 캔들 고가/저가로 SL/TP 정산 (False: 기존 종가 정산)
+        self.drill_timeframe = drill_timeframe  # [NEW] SL/TP가 한 캔들에 같이 닿았을 때 들여다볼 하위 타임프레임
 
-    def fetch_data(self, days, start_date=None):
-        """바이낸스 선물 데이터 수집"""
-        symbol = "BTC/USDT"
-        timeframe = "5m"
-        limit = 1500 
-        
-        all_ohlcv = []
-        
+    def _period(self, days, start_date=None):
+        """백테스트 구간 (since, until) 밀리초. 날짜 형식 오류면 None"""
         if start_date:
             try:
                 dt_obj = datetime.strptime(start_date, "%Y-%m-%d")
                 since = int(dt_obj.timestamp() * 1000)
             except ValueError:
                 print("❌ 날짜 형식이 잘못되었습니다. (YYYY-MM-DD)")
-                return pd.DataFrame()
+                return None
         else:
             since = int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
         
         now = int(datetime.now().timestamp() * 1000)
+        until = min(since + int(days * 86400000), now) if start_date else now
+        return since, until
+
+    def load_candles(self, timeframe, since, until, copy=True, symbol=None):
+        """
+        [NEW] [since, until) 구간 캔들 (N, 6)
+        - 기준 타임프레임의 정수배면 기준 캔들 캐시에서 리샘플링 (추가 다운로드 없음)
+        - 아니면 해당 타임프레임을 직접 캐시/다운로드
+        """
+        symbol, base = symbol or self.symbol, self.base_timeframe
+        if timeframe != base and can_resample(base, timeframe):
+            return self.candle_cache.get_resampled(
+                symbol, timeframe, base, since, until,
+                fetcher=lambda s, u: self._download_ohlcv(symbol, base, s, u)
+            )
+        return self.candle_cache.get_range(
+            symbol, timeframe, since, until,
+            fetcher=lambda s, u: self._download_ohlcv(symbol, timeframe, s, u), copy=copy
+        )
+
+    def cached_lookback(self, timeframe, since, lookback, symbol=None):
+        """[NEW] 지표 워밍업용 앞부분(lookback~since)은 캐시에 있는 만큼만 사용 (워밍업 때문에 다운로드하지 않음)"""
+        symbol = symbol or self.symbol
+        resampled = timeframe != self.base_timeframe and can_resample(self.base_timeframe, timeframe)
+        cached = self.candle_cache.load(symbol, self.base_timeframe if resampled else timeframe)
+        if len(cached) == 0 or cached[0, 0] > since: return lookback
+        first = int(cached[0, 0])
+        if resampled:
+            tf_ms = timeframe_to_ms(timeframe)
+            first = -(-first // tf_ms) * tf_ms  # 온전한 첫 상위 캔들부터
+        return max(lookback, first)
+
+    @property
+    def settlement_mode(self):
+        """[NEW] 실행 기록에 남길 정산 규칙 이름"""
+        return 'intrabar' if self.intrabar else 'close'
+
+    def bars(self, df, intrabar=None):
+        """[NEW] 꼬리 정산용 시가/고가/저가 배열 (종가 정산이면 None). intrabar: None = 이 Backtester 설정"""
+        intrabar = self.intrabar if intrabar is None else intrabar
+        return settlement.bar_arrays(df) if intrabar else None
+
+    def intrabar_resolver(self, timeframe=None, symbol=None, intrabar=None):
+        """[NEW] SL/TP 동시 터치 캔들 판정기 (꼬리 정산이 아니거나 더 짧은 하위 타임프레임이 없으면 None)"""
+        symbol, timeframe = symbol or self.symbol, timeframe or self.timeframe
+        intrabar = self.intrabar if intrabar is None else intrabar
+        if not intrabar or not can_drill(timeframe, self.drill_timeframe): return None
+        return IntrabarResolver(
+            symbol, timeframe, self.drill_timeframe, cache_dir=self.candle_cache.cache_dir,
+            fetcher=lambda s, u: self._download_ohlcv(symbol, self.drill_timeframe, s, u)
+        )
+
+    @staticmethod
+    def to_frame(ohlcv):
+        """(N, 6) 캔들 배열 -> datetime 인덱스 DataFrame"""
+        df = pd.DataFrame(ohlcv, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
+        df['datetime'] = pd.to_datetime(df['datetime'].astype('int64'), unit='ms')
+        return df.set_index('datetime')
+
+    def attach_context(self, df, since, until):
+        """
+        [NEW] 상위 타임프레임 지표를 '{tf}_{지표}' 컬럼으로 붙임
+        - 각 캔들에는 그 캔들이 닫히는 시점까지 이미 닫힌 상위 캔들 값만 사용 (미래 정보 누출 없음)
+        """
+        known_at = df.index + pd.Timedelta(milliseconds=timeframe_to_ms(self.timeframe))  # 캔들이 닫히는 시각
+        for ctx_tf in self.context_timeframes:
+            ctx_ms = timeframe_to_ms(ctx_tf)
+            ohlcv = self.load_candles(ctx_tf, self.cached_lookback(ctx_tf, since, since - CONTEXT_WARMUP * ctx_ms), until)
+            if len(ohlcv) == 0: continue
+            ctx = brain.calculate_indicators(self.to_frame(ohlcv))[CONTEXT_COLUMNS]
+            ctx.index = ctx.index + pd.Timedelta(milliseconds=ctx_ms)  # 상위 캔들이 닫히는 시각 기준
+            ctx.columns = [f"{ctx_tf}_{col}" for col in CONTEXT_COLUMNS]
+            aligned = pd.merge_asof(
+                pd.DataFrame({'known_at': known_at}), ctx.rename_axis('known_at').reset_index(),
+                on='known_at', direction='backward'
+            )
+            for col in ctx.columns:
+                df[col] = aligned[col].to_numpy()
+        return df.dropna()
+
+    def fetch_data(self, days, start_date=None):
+        """바이낸스 선물 데이터 수집 (로컬 캐시 우선, 빈 구간만 다운로드)"""
+        period = self._period(days, start_date)
+        if period is None: return pd.DataFrame()
+        since, until = period
         print(f"📥 데이터 수집 시작... Target: {datetime.fromtimestamp(since/1000)}")
         
-        while since < now:
-            try:
-                ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit, since=since)
-                if not ohlcv: break
-                
-                all_ohlcv.extend(ohlcv)
-                last_timestamp = ohlcv[-1][0]
-                since = last_timestamp + 300000 
-                
-                print(f"   -> {len(ohlcv)}개 수집 완료 (Last: {datetime.fromtimestamp(last_timestamp/1000)})")
-                time.sleep(0.1)
+        ohlcv = self.load_candles(self.timeframe, since, until)
+        print(f"   -> 총 {len(ohlcv)}개 캔들 준비 완료 ({self.timeframe})")
                 
-                if start_date and len(all_ohlcv) * 5 > days * 1440: break
-
-            except Exception as e:
-                print(f"❌ 데이터 수집 오류: {e}")
-                break
-                
-        df = pd.DataFrame(all_ohlcv, columns=['datetime', 'open', 'high', 'low', 'close', 'volume'])
-        if not df.empty:
-            df['datetime'] = pd.to_datetime(df['datetime'], unit='ms')
-            df.set_index('datetime', inplace=True)
-            try:
-                # 지표 계산 (EMA, ATR 등 포함)
-                df = brain.calculate_indicators(df)
-                df.dropna(inplace=True)
-            except Exception as e:
-                print(f"❌ 지표 계산 오류: {e}")
+        if len(ohlcv) == 0: return pd.DataFrame()
+        df = self.to_frame(ohlcv)
+        try:
+            # 지표 계산 (EMA, ATR 등 포함)
+            df = brain.calculate_indicators(df)
+            df.dropna(inplace=True)
+            if self.context_timeframes:
+                df = self.attach_context(df, since, until)
+        except Exception as e:
+            print(f"❌ 지표 계산 오류: {e}")
         
         return df
 
-    def call_with_retry(self, model, prompt, worker_id):
-        """스마트 재시도 로직"""
-        max_retries = 5
-        base_wait = 20 
-        
-        for attempt in range(max_retries):
-            try:
-                response = model.generate_content(prompt)
-                return response
-            except Exception as e:
-                err_msg = str(e)
-                if "429" in err_msg or "Resource has been exhausted" in err_msg or "quota" in err_msg.lower():
-                    wait_time = base_wait * (2 ** attempt)
-                    print(f"⚠️ Worker-{worker_id}: 할당량 초과(429). {wait_time}초 대기 후 재시도... (시도 {attempt+1}/{max_retries})")
-                    time.sleep(wait_time)
-                else:
-                    print(f"⚠️ Worker-{worker_id} API Error: {err_msg}")
-                    time.sleep(5)
-                    if attempt == max_retries - 1: return None
-        return None
+    @staticmethod
+    def make_exchange():
+        return ccxt.binanceusdm({
+            'enableRateLimit': True,
+            'options': {'defaultType': 'future'}
+        })
+
+    def _thread_exchange(self):
+        """
+        [NEW] 다운로드 스레드 전용 ccxt 인스턴스 (동기 ccxt 객체는 HTTP 세션/스로틀 상태를 가져서 스레드 간 공유하지 않음)
+        마켓 정보는 메인 인스턴스에서 복사 (스레드마다 load_markets 요청하지 않음)
+        """
+        exchange = getattr(self._download_local, 'exchange', None)
+        if exchange is None:
+            exchange = self.make_exchange()
+            exchange.set_markets(self.exchange.markets, self.exchange.currencies)
+            self._download_local.exchange = exchange
+        return exchange
 
-    def analyze_chunk_strict(self, chunk, api_key, worker_id):
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash') # [유지] 2.5 Flash
+    def _download_ohlcv(self, symbol, timeframe, since, until):
+        """
+        [since, until) 구간을 API에서 수집
+        [NEW] 캔들 격자가 정해져 있으므로 limit개 단위 창으로 나눠 동시에 받음 (공용 속도 제한, 창별 재시도)
+        - 재시도 후에도 실패한 창이 있으면 그 앞까지의 연속 구간만 반환 (캐시에 빈틈이 생기지 않도록)
+        """
+        limit = 1500 
+        tf_ms = timeframe_to_ms(timeframe)
+        since = -(-int(since) // tf_ms) * tf_ms
+        until = int(until)
+        windows = [(s, min(s + limit * tf_ms, until)) for s in range(since, until, limit * tf_ms)]
+        if not windows: return []
         
-        results = {}
-        request_count = 0
+        try:
+            self.exchange.load_markets()  # 스레드들이 동시에 마켓 정보를 받지 않도록 먼저 로드
+        except Exception as e:
+            print(f"❌ 데이터 수집 오류: {e}")
+            return []
+        
+        parts = {}
+        failed = []
+        with ThreadPoolExecutor(max_workers=min(DOWNLOAD_CONCURRENCY, len(windows))) as pool:
+            futures = {pool.submit(self._download_window, symbol, timeframe, s, u, limit): s for s, u in windows}
+            for future in as_completed(futures):
+                start = futures[future]
+                try:
+                    parts[start] = future.result()
+                except Exception as e:
+                    failed.append(start)
+                    print(f"❌ 데이터 수집 오류 ({datetime.fromtimestamp(start/1000)}~): {e}")
         
-        print(f"🧵 Worker-{worker_id} 시작 ({len(chunk)}개 처리 예정)")
+        if failed:
+            first_failed = min(failed)
+            print(f"⚠️ {len(failed)}개 구간 수집 실패 -> {datetime.fromtimestamp(first_failed/1000)} 이전까지만 사용")
+            parts = {s: rows for s, rows in parts.items() if s < first_failed}
         
-        for idx, row in chunk.iterrows():
-            if request_count >= 250:
-                print(f"🛑 Worker-{worker_id} 안전을 위해 종료 (250회 도달)")
-                break
+        # 중복 제거 + 정렬 + 연속성 확인
+        merged = {}
+        for start in sorted(parts):
+            for candle in parts[start]:
+                merged[candle[0]] = candle
+        all_ohlcv = [merged[ts] for ts in sorted(merged)]
+        gaps = sum(1 for a, b in zip(all_ohlcv, all_ohlcv[1:]) if b[0] - a[0] != tf_ms)
+        if gaps:
+            print(f"⚠️ 거래소 데이터 자체에 빈 구간 {gaps}곳 (점검 시간 등)")
+        return all_ohlcv
+
+    def _download_window(self, symbol, timeframe, since, until, limit):
+        """창 1개 [since, until) 수집 (워커 스레드). 요청이 실패하면 이 창만 지수 백오프로 재시도"""
+        tf_ms = timeframe_to_ms(timeframe)
+        exchange = self._thread_exchange()
+        rows = []
+        while since < until:
+            for attempt in range(DOWNLOAD_RETRIES):
+                self.download_limiter.acquire()
+                try:
+                    ohlcv = exchange.fetch_ohlcv(symbol, timeframe, limit=limit, since=since)
+                    break
+                except Exception as e:
+                    if attempt == DOWNLOAD_RETRIES - 1: raise
+                    wait = 2 ** attempt
+                    print(f"⚠️ 캔들 수집 재시도 {attempt + 1}/{DOWNLOAD_RETRIES - 1} ({datetime.fromtimestamp(since/1000)}~, {wait}초 후): {e}")
+                    time.sleep(wait)
+            if not ohlcv: break
             
-            # [수정] 전문가용 데이터 포맷팅
-            data_str = f"""
-            [Current Market Data (5m Candle)]
+            rows.extend(c for c in ohlcv if since <= c[0] < until)
+            last_timestamp = ohlcv[-1][0]
+            if last_timestamp + tf_ms <= since: break  # 더 진행되지 않음 (비정상 응답)
+            since = last_timestamp + tf_ms
+        
+        if rows:
+            print(f"   -> {len(rows)}개 수집 완료 (Last: {datetime.fromtimestamp(rows[-1][0]/1000)})")
+        return rows
+
+    def format_candle(self, row):
+        """캔들 1개(지표 포함 row)를 프롬프트용 텍스트로 변환"""
+        # [수정] 전문가용 데이터 포맷팅
+        return f"""
+            [Current Market Data ({self.timeframe} Candle)]
             - Timestamp: {row.name}
             - Close Price: {row['close']}
             - Volume Ratio: {row['vol_ratio']:.2f} (vs 20-period Avg)
@@ -123,14 +310,30 @@ class Backtester:
             - MACD: {row['MACD']:.2f} (Signal: {row['MACD_Signal']:.2f})
             - ATR(14): {row['ATR']:.2f} (Use this for SL/TP calculation)
             - BB Position: {(row['close'] - row['BB_Low']) / (row['BB_Up'] - row['BB_Low']):.2f}
+            """ + "".join(self.format_context(row, ctx_tf) for ctx_tf in self.context_timeframes)
+
+    def format_context(self, row, ctx_tf):
+        """[NEW] 상위 타임프레임 지표 섹션 (attach_context로 붙인 컬럼)"""
+        col = lambda name: row[f"{ctx_tf}_{name}"]
+        return f"""
+            [Higher Timeframe ({ctx_tf}, last closed candle)]
+            - Close Price: {col('close')}
+            - Trend Status: {'Bullish (Up)' if col('EMA50') > col('EMA200') else 'Bearish (Down)'} (EMA_50 {col('EMA50'):.2f} / EMA_200 {col('EMA200'):.2f})
+            - RSI(14): {col('RSI'):.1f}
+            - MACD: {col('MACD'):.2f} (Signal: {col('MACD_Signal'):.2f})
+            - ATR(14): {col('ATR'):.2f}
             """
-            
-            # [수정] 월스트리트 트레이더 페르소나 프롬프트
-            prompt = f"""
+
+    def build_prompt(self, row):
+        """캔들 1개에 대한 판단 요청 프롬프트"""
+        data_str = self.format_candle(row)
+        
+        # [수정] 월스트리트 트레이더 페르소나 프롬프트
+        return f"""
             Act as a World-Class Bitcoin Futures Trader (Scalper).
             Your goal is to maximize profit while strictly managing risk.
             
-            Based on the provided 5-minute chart data:
+            Based on the provided {timeframe_label(self.timeframe)} chart data:
             1. Analyze the **Trend** using EMA and recent price action.
             2. Analyze **Momentum** using RSI and MACD.
             3. Confirm trade validity with **Volume Ratio** (High volume = Stronger signal).
@@ -147,22 +350,267 @@ class Backtester:
             Strict Output JSON:
             {{"decision": "long/short/hold", "confidence": 0-100, "sl": price, "tp": price}}
             """
+
+    def build_batch_prompt(self, rows):
+        """[NEW] 캔들 N개를 한 번에 묻는 프롬프트 (타임스탬프별 JSON 배열 응답)"""
+        data_str = "\n".join(
+            f"            [Candle {i+1}]{self.format_candle(row)}" for i, (_, row) in enumerate(rows.iterrows())
+        )
+        
+        return f"""
+            Act as a World-Class Bitcoin Futures Trader (Scalper).
+            Your goal is to maximize profit while strictly managing risk.
             
-            response = self.call_with_retry(model, prompt, worker_id)
+            You are given {len(rows)} separate {timeframe_label(self.timeframe)} candles. Judge EACH candle independently,
+            as if it were the latest candle at its own timestamp:
+            1. Analyze the **Trend** using EMA and recent price action.
+            2. Analyze **Momentum** using RSI and MACD.
+            3. Confirm trade validity with **Volume Ratio** (High volume = Stronger signal).
+            4. Determine entry direction (LONG/SHORT) or stay neutral (HOLD).
             
-            if response:
-                try:
-                    text = response.text.replace("```json", "").replace("```", "").strip()
-                    results[idx] = json.loads(text)
-                    request_count += 1
-                except:
-                    pass 
+            **Risk Management Rules:**
+            - Set Stop Loss (SL) at 1.5 * ATR from entry price.
+            - Set Take Profit (TP) at 2.0 * ATR from entry price (Risk:Reward = 1:1.3+).
+            - If the trend is ambiguous or signals conflict, choose "HOLD".
             
-            time.sleep(2) 
-                
+            Data:
+{data_str}
+            
+            Strict Output JSON array with exactly one object per candle (copy each Timestamp exactly):
+            [{{"timestamp": "YYYY-MM-DD HH:MM:SS", "decision": "long/short/hold", "confidence": 0-100, "sl": price, "tp": price}}]
+            """
+
+    @staticmethod
+    def parse_batch_response(text, rows):
+        """
+        배치 응답(JSON 배열)을 {Timestamp: 판단} 으로 변환
+        - 요청한 캔들의 타임스탬프와 일치하고 decision/confidence가 올바른 항목만 채택
+        """
+        text = text.replace("```json", "").replace("```", "").strip()
+        items = json.loads(text)
+        if isinstance(items, dict): items = [items]
+        
+        wanted = set(rows.index)
+        results = {}
+        for item in items:
+            if not isinstance(item, dict): continue
+            try:
+                ts = pd.Timestamp(str(item.get('timestamp')))
+                decision = str(item.get('decision', '')).lower()
+                float(item.get('confidence'))
+            except (TypeError, ValueError):
+                continue
+            if ts not in wanted or decision not in ('long', 'short', 'hold'): continue
+            res = {k: v for k, v in item.items() if k != 'timestamp'}
+            results[ts] = res
         return results
 
+    def lookup_cached(self, chunk):
+        """캐시 적중 캔들의 응답과, 실제로 질의해야 할 나머지 캔들 반환 (묶음 조회 1회)"""
+        data_strs = [self.format_candle(row) for _, row in chunk.iterrows()]
+        cached = self.decision_cache.get_many(MODEL_NAME, self.prompt_version, data_strs)
+        results = {idx: res for idx, res in zip(chunk.index, cached) if res is not None}
+        self.cache_stats['hits'] += len(results)
+        self.cache_stats['misses'] += len(chunk) - len(results)
+        if results:
+            chunk = chunk[~chunk.index.isin(list(results.keys()))]
+        return results, chunk
+
+    @property
+    def prompt_version(self):
+        return BATCH_PROMPT_VERSION if self.batch_size > 1 else PROMPT_VERSION
+
+    def request_rows(self, model, rows):
+        """
+        캔들 묶음(rows)을 요청 1회로 질의해 {Timestamp: 판단} 반환 (워커 스레드에서 실행)
+        - batch_size 1이면 기존 단일 캔들 프롬프트, 아니면 배치 프롬프트
+        - API/파싱 오류는 그대로 raise (워커가 재시도 여부 판단)
+        """
+        if self.batch_size == 1:
+            row = rows.iloc[0]
+            response = model.generate_content(self.build_prompt(row))
+            text = response.text.replace("```json", "").replace("```", "").strip()
+            parsed = {rows.index[0]: json.loads(text)}
+        else:
+            response = model.generate_content(self.build_batch_prompt(rows))
+            parsed = self.parse_batch_response(response.text, rows)
+        
+        for ts, res in parsed.items():
+            self.decision_cache.put(MODEL_NAME, self.prompt_version, self.format_candle(rows.loc[ts]), res)
+        return parsed
+
+    def emit_results(self, parsed):
+        if parsed and self.result_sink is not None:
+            self.result_sink(parsed)
+
+    def analyze_rows(self, df, collect=True):
+        """
+        [NEW] 캔들들을 공유 작업 큐에 넣고 키별 워커가 나눠 처리
+        - 캐시 적중분은 요청 없이 반환
+        - 각 키는 자기 토큰 버킷(RPM/RPD) 속도대로 큐에서 꺼내가므로, 느리거나 죽은 키의 몫은 다른 키가 처리
+        - 응답은 도착 즉시 result_sink로 전달. collect=False면 반환용 딕셔너리를 쌓지 않음 (긴 구간 메모리 절약)
+        """
+        results, rest = self.lookup_cached(df)
+        self.emit_results(results)
+        if not collect: results = {}
+        if rest.empty: return results
+        
+        items = [rest.iloc[i:i + self.batch_size] for i in range(0, len(rest), self.batch_size)]
+        results.update(asyncio.run(self._run_pool(items, collect)))
+        return results
+
+    @property
+    def api_keys(self):
+        return self.key_manager.keys
+
+    def usable_keys(self):
+        """곧 사용 가능하고 연속 실패로 중단되지 않은 키"""
+        return [
+            k for k in self.api_keys
+            if self.strikes.get(k, 0) < self.max_strikes and self.key_manager.wait_time(k) <= self.max_key_wait
+        ]
+
+    async def _run_pool(self, items, collect=True):
+        queue = asyncio.Queue()
+        for rows in items:
+            queue.put_nowait((rows, 0))
+        
+        results = {}
+        state = {'in_flight': 0, 'changed': asyncio.Event(), 'collect': collect}
+        keys = self.usable_keys()
+        await asyncio.gather(*(
+            self._pool_worker(k, i+1, queue, results, state) for i, k in enumerate(keys)
+        ))
+        
+        if not queue.empty():
+            print(f"🛑 사용 가능한 키가 없어 {queue.qsize()}개 묶음 미처리")
+        return results
+
+    async def _pool_worker(self, api_key, worker_id, queue, results, state):
+        model = self.client_pool.model_for(api_key) # 키 전용 클라이언트 (전역 configure 사용 안 함)
+        
+        while True:
+            if queue.empty():
+                # 다른 워커가 처리 중인 묶음이 실패해 되돌아올 수 있으므로 끝날 때까지 대기
+                if state['in_flight'] == 0: return
+                state['changed'].clear()
+                await state['changed'].wait()
+                continue
+            
+            # 키 사용 예약 (RPM 토큰 + 일일 카운트). 오래 막힌 키는 남은 작업을 다른 키에 넘기고 종료
+            wait = self.key_manager.try_acquire(api_key)
+            if wait > self.max_key_wait:
+                print(f"🛑 Worker-{worker_id} 키 사용 불가 (일일 한도/정지) - 남은 작업은 다른 키가 처리")
+                return
+            if wait > 0:
+                # 토큰을 기다리는 중에도 작업이 끝나면 바로 깨어나 종료 여부 확인
+                state['changed'].clear()
+                try:
+                    await asyncio.wait_for(state['changed'].wait(), timeout=min(wait, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            try:
+                rows, attempts = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                continue
+            
+            state['in_flight'] += 1
+            penalty = 1  # 429는 캔들 탓이 아니므로 시도 횟수에서 제외
+            try:
+                started = time.monotonic()
+                parsed = await asyncio.to_thread(self.request_rows, model, rows)
+                self.key_manager.report_success(api_key, time.monotonic() - started)
+                self.emit_results(parsed)
+                if state['collect']: results.update(parsed)
+                self.strikes[api_key] = 0
+                missing = rows[~rows.index.isin(list(parsed.keys()))]
+            except Exception as e:
+                err_msg = str(e)
+                self.strikes[api_key] = self.strikes.get(api_key, 0) + 1
+                missing = rows
+                # 429면 키 매니저가 해당 키를 일시/일일 정지시키고, 작업은 다른 키가 가져감
+                self.key_manager.report_error(api_key, e)
+                if is_quota_error(err_msg):
+                    penalty = 0
+                    print(f"⚠️ Worker-{worker_id}: 할당량 초과(429). 다른 키에 작업 양보")
+                else:
+                    print(f"⚠️ Worker-{worker_id} API Error: {err_msg}")
+            
+            # 실패/누락된 캔들은 큐로 되돌려 아무 키나 다시 처리
+            if not missing.empty:
+                if attempts + penalty < self.max_attempts:
+                    queue.put_nowait((missing, attempts + penalty))
+                else:
+                    print(f"⚠️ Worker-{worker_id}: {len(missing)}개 캔들 {self.max_attempts}회 실패로 포기")
+            state['in_flight'] -= 1
+            state['changed'].set()
+            
+            if self.strikes[api_key] >= self.max_strikes:
+                print(f"🛑 Worker-{worker_id} 연속 {self.strikes[api_key]}회 실패로 중단 (남은 작업은 다른 키가 처리)")
+                return
+
+    def evaluate_all(self, df):
+        """[기존 방식] 전체 캔들 전수 분석 (응답은 result_sink로만 전달)"""
+        self.analyze_rows(df, collect=False)
+
+    def evaluate_lazy(self, df, start=0):
+        """
+        [NEW] 시뮬레이션 진행에 맞춰 포지션이 없는 캔들만 AI에 질의
+        - 보유 중인 구간은 어차피 판단이 무시되므로 건너뜀 (최종 매매는 전수 분석과 동일)
+        - 앞 캔들을 (키 개수 × batch_size)개씩 미리 병렬로 물어보고, 진입이 나오면 청산 캔들로 점프
+        - start: 포지션이 없어지는 첫 캔들 (compact 모드에서 이전 창 포지션이 이어질 때)
+        """
+        close = df['close'].to_numpy()
+        bars = self.bars(df)  # 청산 캔들 위치만 필요하므로 동시 터치 판정(resolve)은 생략
+        n = len(df)
+        decisions = settlement.empty_decision_arrays(n)
+        asked = np.zeros(n, dtype=bool)
+        asked[:start] = True  # 이전 포지션 보유 구간은 질의하지 않음
+        cursor = start  # 포지션이 없는 첫 캔들 (시뮬레이션 시계)
+        
+        while True:
+            # 1. 이미 질의한 캔들은 바로 시뮬레이션: 진입 시 청산 캔들로 점프
+            while cursor < n and asked[cursor]:
+                if settlement.is_entry(decisions, cursor):
+                    side, sl, tp = settlement.position_levels(decisions, cursor, close[cursor])
+                    exit_idx, _ = settlement.find_exit(close, cursor + 1, side, sl, tp, bars=bars)
+                    cursor = n if exit_idx is None else exit_idx
+                else:
+                    cursor += 1
+            if cursor >= n: break
+            
+            keys = self.usable_keys()
+            if not keys:
+                print("🛑 사용 가능한 키가 없어 지연 분석 종료")
+                break
+            
+            # 2. 포지션이 없는 다음 캔들들을 공유 큐로 병렬 질의
+            batch = list(range(cursor, min(n, cursor + len(keys) * self.batch_size)))
+            batch_results = self.analyze_rows(df.iloc[batch])
+            
+            asked[batch] = True
+            answered = [j for j in batch if df.index[j] in batch_results]
+            settlement.fill_decisions(decisions, answered, [batch_results[df.index[j]] for j in answered])
+        
+        queried = int(asked.sum()) - start
+        print(f"💡 지연 분석: {n}개 캔들 중 {queried}개만 질의 ({n - queried}개 생략)")
+        return decisions
+
+    def _decision_sink(self, df, decisions, recorder):
+        """응답이 도착하는 대로 df 안 정수 위치 기준 판단 배열에 채우고 DB에 묶음 단위로 스트리밍 저장"""
+        def sink(parsed):
+            positions = df.index.get_indexer(list(parsed.keys()))
+            valid = positions >= 0
+            settlement.fill_decisions(decisions, positions[valid], [res for res, ok in zip(parsed.values(), valid) if ok])
+            if recorder: recorder.add_decisions(parsed)
+        return sink
+
     def run(self, days, start_date=None, duration_minutes=None):
+        if self.compact_window > 0:
+            return self.run_compact(days, start_date, duration_minutes)
+        
         # 1. 데이터 수집
         df = self.fetch_data(days, start_date)
         
@@ -176,125 +624,354 @@ class Backtester:
         
         print(f"📊 총 {len(df)}개 캔들 분석 시작 (Worker {len(self.api_keys)}명 투입)")
         
-        # 2. 데이터 분할
-        num_keys = len(self.api_keys)
-        if num_keys == 0: return {}
-
-        chunk_size = len(df) // num_keys + 1
-        chunks = [df.iloc[i*chunk_size : (i+1)*chunk_size] for i in range(num_keys)]
-        
-        # 3. 병렬 실행
-        ai_results = {}
-        with ThreadPoolExecutor(max_workers=num_keys) as executor:
-            futures = []
-            for i in range(num_keys):
-                if len(chunks[i]) > 0:
-                    futures.append(executor.submit(self.analyze_chunk_strict, chunks[i], self.api_keys[i], i+1))
-                    print(f"⏳ Worker-{i+1} 준비 중... (5초 대기)")
-                    time.sleep(5)
-            
-            for future in futures:
-                try:
-                    res = future.result()
-                    ai_results.update(res)
-                except Exception as e:
-                    print(f"Worker Exception: {e}")
+        if len(self.api_keys) == 0: return {}
+        self.strikes = {}
+        self.cache_stats = {'hits': 0, 'misses': 0}
+
+        # [NEW] 응답은 도착하는 대로 판단 배열에 채우고 DB에 묶음 단위로 스트리밍 저장
+        decisions = settlement.empty_decision_arrays(len(df))
+        recorder = None
+        try:
+            recorder = BacktestDB(db_name=RESULTS_DB).open_run(
+                days, self.initial_balance,
+                symbol=self.symbol, timeframe=self.timeframe, start_time=df.index[0], end_time=df.index[-1],
+                settlement=self.settlement_mode
+            )
+        except Exception as e:
+            print(f"❌ DB 저장 시작 실패 (결과는 저장되지 않음): {e}")
+        
+        self.result_sink = self._decision_sink(df, decisions, recorder)
+
+        # 2~3. AI 분석 (전수 / 지연 모드)
+        try:
+            if self.lazy_eval:
+                self.evaluate_lazy(df)
+            else:
+                self.evaluate_all(df)
+        except Exception:
+            if recorder: recorder.finish({}, [], status='failed')
+            raise
+        finally:
+            self.result_sink = None
+        
+        cache_hits, cache_misses = self.cache_stats['hits'], self.cache_stats['misses']
+        print(f"🗃️ AI 캐시: 적중 {cache_hits}개 / 미스 {cache_misses}개")
 
         # 4. 시뮬레이션
         print("\n🚀 시뮬레이션 정산 시작...")
-        balance = self.initial_balance
-        position = None
-        trades = []
-        logs = []
-        wins = 0
-        total_trades = 0
-        FEE_RATE = 0.0004
-        
-        for idx, row in df.iterrows():
-            curr_price = row['close']
-            
-            # 청산 로직
-            if position:
-                side = position['side']
-                entry_price = position['entry_price']
-                amount = position['amount']
-                sl = position.get('sl')
-                tp = position.get('tp')
-                
-                is_closed, reason = False, ""
-                
-                if side == 'long':
-                    if sl and curr_price <= sl: is_closed, reason = True, "SL"
-                    elif tp and curr_price >= tp: is_closed, reason = True, "TP"
-                else: 
-                    if sl and curr_price >= sl: is_closed, reason = True, "SL"
-                    elif tp and curr_price <= tp: is_closed, reason = True, "TP"
-                
-                if is_closed:
-                    pnl_money = (curr_price - entry_price) * amount if side == 'long' else (entry_price - curr_price) * amount
-                    fee = curr_price * amount * FEE_RATE
-                    net_pnl = pnl_money - fee
-                    balance += net_pnl + (amount * entry_price) 
-                    
-                    roi_trade = (net_pnl / (amount * entry_price)) * 100
-                    trades.append({'time': idx, 'roi': roi_trade, 'pnl': net_pnl, 'reason': reason})
-                    logs.append(f"[{idx}] ⚡ {side.upper()} 청산 ({reason}): {roi_trade:.2f}%")
-                    
-                    if net_pnl > 0: wins += 1
-                    total_trades += 1
-                    position = None
-            
-            # 진입 로직
-            if position is None and idx in ai_results:
-                res = ai_results[idx]
-                decision = res.get('decision', 'hold').lower()
-                conf = res.get('confidence', 0)
-                
-                if decision in ['long', 'short'] and conf >= 70:
-                    # [백테스트 자금관리] 99% 풀매수
-                    invest = balance * 0.99
-                    amount = invest / curr_price
-                    balance -= invest
-                    
-                    sl = res.get('sl')
-                    tp = res.get('tp')
-                    
-                    # AI가 ATR 기반 SL/TP를 못 줬을 경우의 안전망 (백테스터는 안전망 필수)
-                    if not sl:
-                        sl = curr_price * 0.98 if decision == 'long' else curr_price * 1.02
-                    
-                    position = {
-                        'side': decision,
-                        'entry_price': curr_price,
-                        'amount': amount,
-                        'sl': sl,
-                        'tp': tp
-                    }
-                    logs.append(f"[{idx}] 🚀 {decision.upper()} 진입 (Conf: {conf}%)")
+        resolver = self.intrabar_resolver()
+        sim = settlement.simulate(df['close'].to_numpy(), decisions, self.initial_balance, times=df.index,
+                                  bars=self.bars(df), resolve=resolver)
+        if resolver: print(f"🔍 {resolver.summary()}")
+        balance = sim['balance']
+        trades = sim['trades']
+        logs = sim['logs']
+        wins = sim['wins']
+        total_trades = sim['total_trades']
 
         final_roi = ((balance / self.initial_balance) - 1) * 100
         win_rate = (wins / total_trades * 100) if total_trades > 0 else 0
         
-        # DB 저장
-        try:
-            print("💾 백테스팅 결과 DB 저장 중...")
-            db = BacktestDB(db_name="backtest_results.db")
-            summary = {
-                "days": days,
-                "initial_balance": self.initial_balance,
-                "final_balance": balance,
-                "roi": final_roi,
-                "win_rate": win_rate
-            }
-            run_id = db.save_results(summary, ai_results, trades)
-            print(f"✅ 저장 완료 (Run ID: {run_id})")
-        except Exception as e:
-            print(f"❌ DB 저장 실패: {e}")
+        # DB 저장 (판단은 이미 스트리밍 저장됨 -> 남은 묶음 + 체결 + 요약만 기록)
+        run_id = None
+        if recorder:
+            try:
+                print("💾 백테스팅 결과 DB 저장 중...")
+                summary = {
+                    "final_balance": balance,
+                    "roi": final_roi,
+                    "win_rate": win_rate
+                }
+                run_id = recorder.finish(summary, trades)
+                print(f"✅ 저장 완료 (Run ID: {run_id})")
+            except Exception as e:
+                print(f"❌ DB 저장 실패: {e}")
 
         return {
             "final_balance": balance,
             "roi": final_roi,
             "win_rate": win_rate,
             "trades": trades,
-            "logs": logs
+            "logs": logs,
+            "cache_hits": cache_hits,
+            "cache_misses": cache_misses,
+            "run_id": run_id
         }
+
+    def iter_compact_windows(self, days, start_date=None, duration_minutes=None):
+        """
+        [NEW] 구간 캔들을 캐시(mmap)에서 compact_window개씩 잘라 지표까지 계산한 DataFrame 창으로 내보냄
+        - 지표는 brain.ChunkedIndicators (float32, 중간 지표 제외, 창 사이 워밍업 상태 이어받기)
+        - 상위 타임프레임 컨텍스트(context_timeframes)는 지원하지 않음
+        """
+        period = self._period(days, start_date)
+        if period is None: return
+        since, until = period
+        print(f"📥 데이터 수집 시작 (compact)... Target: {datetime.fromtimestamp(since/1000)}")
+        if self.context_timeframes:
+            print("⚠️ compact 모드에서는 상위 타임프레임 컨텍스트를 생략합니다.")
+        
+        # 빈 구간만 다운로드해서 캐시를 채운 뒤, 전체를 메모리에 올리지 않고 mmap에서 창 단위로 읽음
+        # (리샘플링하는 타임프레임은 기준 캔들보다 훨씬 작으므로 결과 배열을 그대로 사용)
+        cached = self.load_candles(self.timeframe, since, until, copy=False)
+        if self.timeframe == self.base_timeframe or not can_resample(self.base_timeframe, self.timeframe):
+            cached = self.candle_cache.load(self.symbol, self.timeframe)
+        if len(cached) == 0: return
+        lo = int(np.searchsorted(cached[:, 0], since, side='left'))
+        hi = int(np.searchsorted(cached[:, 0], until, side='left'))
+        print(f"   -> 총 {hi - lo}개 캔들, {self.compact_window}개 단위 창으로 처리")
+        
+        indicators = brain.ChunkedIndicators()
+        end_dt = None
+        for start in range(lo, hi, self.compact_window):
+            window = indicators.update(cached[start:min(hi, start + self.compact_window)])
+            if window.empty: continue
+            if duration_minutes:
+                if end_dt is None:
+                    end_dt = window.index[0] + timedelta(minutes=duration_minutes)
+                window = window[window.index <= end_dt]
+                if window.empty: break
+            yield window
+
+    def run_compact(self, days, start_date=None, duration_minutes=None):
+        """
+        [NEW] 긴 구간용 compact 모드: 창마다 지표 -> AI 판단 -> 정산 -> DB 저장까지 흘려보냄
+        - 판단은 창 안 정수 위치 배열로만 보관, 체결은 창마다 DB로 저장, 로그는 최근 COMPACT_LOG_TAIL줄만 유지
+        - 메모리 사용량은 전체 기간이 아니라 창 크기(compact_window)에 비례
+        """
+        print(f"📊 compact 모드 분석 시작 (Worker {len(self.api_keys)}명 투입)")
+        if len(self.api_keys) == 0: return {}
+        self.strikes = {}
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        
+        resolver = self.intrabar_resolver()
+        settler = settlement.Settler(self.initial_balance, logs=deque(maxlen=COMPACT_LOG_TAIL), resolve=resolver)
+        recorder = None
+        candles = 0
+        last_ts = None
+        try:
+            for window in self.iter_compact_windows(days, start_date, duration_minutes):
+                if last_ts is None:
+                    try:
+                        recorder = BacktestDB(db_name=RESULTS_DB).open_run(
+                            days, self.initial_balance,
+                            symbol=self.symbol, timeframe=self.timeframe, start_time=window.index[0],
+                            settlement=self.settlement_mode
+                        )
+                    except Exception as e:
+                        print(f"❌ DB 저장 시작 실패 (결과는 저장되지 않음): {e}")
+                
+                # 1. AI 판단 (응답은 창 안 정수 위치 배열로)
+                close = window['close'].to_numpy()
+                bars = self.bars(window)
+                decisions = settlement.empty_decision_arrays(len(window))
+                self.result_sink = self._decision_sink(window, decisions, recorder)
+                if self.lazy_eval:
+                    self.evaluate_lazy(window, start=settler.flat_index(close, bars))
+                else:
+                    self.evaluate_all(window)
+                self.result_sink = None
+                
+                # 2. 정산 (보유 포지션은 다음 창으로) + 체결은 바로 DB로
+                settler.feed(close, decisions, times=window.index, bars=bars)
+                trades = settler.pop_trades()
+                if recorder: recorder.add_trades(trades)
+                
+                candles += len(window)
+                last_ts = window.index[-1]
+                print(f"   -> {last_ts}까지 {candles}개 캔들 정산 (누적 {settler.total_trades}회 매매)")
+        except Exception:
+            if recorder: recorder.finish({}, [], status='failed', end_time=last_ts)
+            raise
+        finally:
+            self.result_sink = None
+        
+        if last_ts is None:
+            print("❌ 데이터 없음")
+            return {"final_balance": self.initial_balance, "roi": 0, "win_rate": 0, "trades": [], "logs": []}
+        
+        cache_hits, cache_misses = self.cache_stats['hits'], self.cache_stats['misses']
+        print(f"🗃️ AI 캐시: 적중 {cache_hits}개 / 미스 {cache_misses}개")
+        if resolver: print(f"🔍 {resolver.summary()}")
+        
+        balance = settler.balance
+        total_trades = settler.total_trades
+        final_roi = ((balance / self.initial_balance) - 1) * 100
+        win_rate = (settler.wins / total_trades * 100) if total_trades > 0 else 0
+        
+        run_id = None
+        if recorder:
+            try:
+                summary = {"final_balance": balance, "roi": final_roi, "win_rate": win_rate}
+                run_id = recorder.finish(summary, [], end_time=last_ts)
+                print(f"✅ 저장 완료 (Run ID: {run_id})")
+            except Exception as e:
+                print(f"❌ DB 저장 실패: {e}")
+        
+        return {
+            "final_balance": balance,
+            "roi": final_roi,
+            "win_rate": win_rate,
+            "trades": [],  # 체결 내역은 DB에만 저장 (Run ID로 조회)
+            "total_trades": total_trades,
+            "logs": list(settler.logs),
+            "cache_hits": cache_hits,
+            "cache_misses": cache_misses,
+            "run_id": run_id
+        }
+
+    def load_run_arrays(self, run_id, mode=None):
+        """
+        [NEW] 저장된 실행의 캔들/판단을 정산용 배열로 복원 (AI 호출 없음). 기록/캔들이 없으면 None
+        mode: 'close' / 'intrabar' (None = 그 실행이 저장될 때의 정산 규칙 -> 기존 결과와 같은 규칙으로 비교)
+        반환: {'base', 'mode', 'index', 'close', 'atr', 'bars', 'resolver', 'decisions', 'initial_balance'}
+        """
+        if mode is not None and mode not in SETTLEMENT_MODES:
+            raise ValueError(f"알 수 없는 정산 규칙: {mode}")
+        db = BacktestDB(db_name=RESULTS_DB)
+        try:
+            base = db.get_run(run_id)
+            if base is None: return None
+            start_time, end_time = base.get('start_time'), base.get('end_time')
+            if not start_time:
+                start_time, end_time = db.decision_range(run_id)  # 구간 정보가 없는 예전 실행
+            stored = db.load_decisions(run_id) if start_time else None
+        finally:
+            db.close()
+        if not start_time: return None
+        mode = mode or base.get('settlement') or 'close'  # 컬럼이 없던 예전 실행 = 종가 정산
+        symbol = base.get('symbol') or self.symbol
+        timeframe = base.get('timeframe') or self.timeframe
+        
+        # 1. 같은 구간 캔들 (로컬 캐시에서 바로 읽힘) + ATR 계산용 앞부분
+        tf_ms = timeframe_to_ms(timeframe)
+        since = int(pd.Timestamp(start_time).value // 1_000_000)
+        until = int(pd.Timestamp(end_time).value // 1_000_000) + tf_ms
+        lookback = self.cached_lookback(timeframe, since, since - ATR_WARMUP * tf_ms, symbol)
+        ohlcv = self.load_candles(timeframe, lookback, until, symbol=symbol)
+        if len(ohlcv) == 0: return None
+        df = brain.calculate_indicators(self.to_frame(ohlcv))
+        df = df[df.index >= pd.Timestamp(start_time)]
+        if df.empty: return None
+        
+        # 2. 저장된 판단 -> 배열
+        ai_results = dict(zip(pd.to_datetime(list(stored.keys())), stored.values()))
+        intrabar = mode == 'intrabar'
+        return {
+            'base': base,
+            'mode': mode,
+            'index': df.index,
+            'close': df['close'].to_numpy(dtype=np.float64),
+            'atr': df['ATR'].to_numpy(dtype=np.float64),
+            'bars': self.bars(df, intrabar),
+            'resolver': self.intrabar_resolver(timeframe, symbol, intrabar),
+            'decisions': settlement.build_decision_arrays(df.index, ai_results),
+            'initial_balance': base['initial_balance'] or self.initial_balance
+        }
+
+    def resimulate(self, run_id, mode=None, **params):
+        """
+        [NEW] 저장된 실행의 AI 판단으로 정산 엔진만 다시 돌림 (AI 호출 없음)
+        params: settlement.SIM_PARAMS (생략 시 기존 규칙), mode: 정산 규칙 (None = 실행 기록의 규칙)
+        """
+        unknown = set(params) - set(settlement.SIM_PARAMS)
+        if unknown:
+            raise ValueError(f"알 수 없는 파라미터: {', '.join(sorted(unknown))}")
+        
+        arrays = self.load_run_arrays(run_id, mode)
+        if arrays is None: return None
+        base, initial_balance = arrays['base'], arrays['initial_balance']
+        sim = settlement.simulate(arrays['close'], arrays['decisions'], initial_balance, times=arrays['index'],
+                                  atr=arrays['atr'], bars=arrays['bars'], resolve=arrays['resolver'], **params)
+        
+        total_trades = sim['total_trades']
+        return {
+            "base_run_id": run_id,
+            "base_roi": base['roi'],
+            "base_win_rate": base['win_rate'],
+            "base_trades": base['total_trades'],
+            "base_mode": base.get('settlement') or 'close',
+            "mode": arrays['mode'],
+            "params": params,
+            "final_balance": sim['balance'],
+            "roi": ((sim['balance'] / initial_balance) - 1) * 100,
+            "win_rate": (sim['wins'] / total_trades * 100) if total_trades > 0 else 0,
+            "trades": sim['trades'],
+            "logs": sim['logs']
+        }
+
+    def sweep(self, run_id, grid, max_workers=None, mode=None):
+        """
+        [NEW] 저장된 판단으로 grid의 모든 파라미터 조합을 병렬 정산 -> ROI 순위표를 DB에 저장
+        grid: {'conf_threshold': [60, 70, 80], 'sl_atr': [1, 1.5, 2], ...}
+        mode: 정산 규칙 (None = 실행 기록의 규칙). SL/TP 동시 터치 캔들은 1m 캐시에 있는 만큼만 드릴다운 (워커에서는 다운로드하지 않음, 없으면 SL 우선)
+        반환: (sweep_id, 순위순 결과 목록). 기록/캔들이 없으면 None
+        """
+        arrays = self.load_run_arrays(run_id, mode)
+        if arrays is None: return None
+        resolver = arrays['resolver']
+        if resolver: resolver.fetcher = None  # 순위는 캐시된 1m만으로 (워커 수와 무관하게 같은 결과)
+        
+        started = time.perf_counter()
+        ranked = param_sweep.run_sweep(
+            arrays['close'], arrays['decisions'], arrays['initial_balance'], grid,
+            atr=arrays['atr'], max_workers=max_workers, bars=arrays['bars'], resolve=resolver
+        )
+        elapsed = time.perf_counter() - started
+        db = BacktestDB(db_name=RESULTS_DB)
+        try:
+            sweep_id = db.save_sweep(run_id, grid, ranked, elapsed)
+        finally:
+            db.close()
+        print(f"🧮 Run {run_id} 파라미터 탐색 {len(ranked)}조합 완료 ({elapsed:.2f}초) -> Sweep #{sweep_id}")
+        return sweep_id, ranked
+
+if __name__ == "__main__":
+    # [NEW] CLI 재정산: python parallel_backtester.py resim 12 --conf 80 --fee 0.0002
+    parser = argparse.ArgumentParser(description="저장된 백테스트 판단으로 정산만 다시 실행 / 파라미터 탐색")
+    sub = parser.add_subparsers(dest="command", required=True)
+    resim = sub.add_parser("resim", help="run_id의 판단으로 재정산")
+    resim.add_argument("run_id", type=int)
+    resim.add_argument("--conf", type=float, dest="conf_threshold", help="진입 확신도 기준 (기본 70)")
+    resim.add_argument("--fee", type=float, dest="fee_rate", help="청산 수수료율 (기본 0.0004)")
+    resim.add_argument("--size", type=float, dest="size_frac", help="진입 비중 (기본 0.99)")
+    resim.add_argument("--sl", type=float, dest="sl_fallback", help="SL 누락 시 안전망 비율 (기본 0.02)")
+    resim.add_argument("--sl-atr", type=float, dest="sl_atr", help="SL = 진입가 ∓ ATR x 배수 (기본 0 = AI 값)")
+    resim.add_argument("--tp-atr", type=float, dest="tp_atr", help="TP = 진입가 ± ATR x 배수 (기본 0 = AI 값)")
+    resim.add_argument("--settlement", choices=SETTLEMENT_MODES, default=None,
+                       help="SL/TP 정산 규칙: close(종가) / intrabar(캔들 꼬리) (기본 = 실행 기록의 규칙)")
+    
+    # [NEW] 그리드 탐색: python parallel_backtester.py sweep 12 --conf 60,70,80 --sl-atr 1,1.5,2 --tp-atr 2,3
+    floats = lambda text: [float(v) for v in text.split(',') if v.strip()]
+    sweep = sub.add_parser("sweep", help="run_id의 판단으로 파라미터 조합 전체를 병렬 정산")
+    sweep.add_argument("run_id", type=int)
+    sweep.add_argument("--conf", type=floats, dest="conf_threshold", help="진입 확신도 기준 목록 (예: 60,70,80)")
+    sweep.add_argument("--fee", type=floats, dest="fee_rate", help="청산 수수료율 목록")
+    sweep.add_argument("--size", type=floats, dest="size_frac", help="진입 비중 목록")
+    sweep.add_argument("--sl", type=floats, dest="sl_fallback", help="SL 안전망 비율 목록")
+    sweep.add_argument("--sl-atr", type=floats, dest="sl_atr", help="SL ATR 배수 목록")
+    sweep.add_argument("--tp-atr", type=floats, dest="tp_atr", help="TP ATR 배수 목록")
+    sweep.add_argument("--workers", type=int, default=None, help="프로세스 수 (기본 = CPU 코어 수)")
+    sweep.add_argument("--top", type=int, default=10, help="출력할 상위 조합 수")
+    sweep.add_argument("--settlement", choices=SETTLEMENT_MODES, default=None,
+                       help="SL/TP 정산 규칙: close(종가) / intrabar(캔들 꼬리) (기본 = 실행 기록의 규칙)")
+    args = parser.parse_args()
+    
+    params = {k: getattr(args, k) for k in settlement.SIM_PARAMS if getattr(args, k) is not None}
+    if args.command == "sweep":
+        result = Backtester(key_manager=None).sweep(args.run_id, params, max_workers=args.workers, mode=args.settlement)
+        if result is None:
+            print(f"❌ Run {args.run_id} 기록(또는 캔들)이 없습니다.")
+        else:
+            sweep_id, ranked = result
+            for rank, r in enumerate(ranked[:args.top], start=1):
+                print(f"   {rank:>3}. ROI {r['roi']:+.2f}% / 승률 {r['win_rate']:.1f}% / {r['total_trades']}회 - {r['params']}")
+    else:
+        started = time.perf_counter()
+        result = Backtester(key_manager=None).resimulate(args.run_id, mode=args.settlement, **params)
+        if result is None:
+            print(f"❌ Run {args.run_id} 기록(또는 캔들)이 없습니다.")
+        else:
+            print(f"♻️ Run {args.run_id} 재정산 {params or '(기본 규칙)'} - {time.perf_counter() - started:.2f}초")
+            print(f"   기존 ({result['base_mode']}): ROI {result['base_roi'] or 0:+.2f}% / 승률 {result['base_win_rate'] or 0:.1f}% / {result['base_trades'] or 0}회")
+            print(f"   재정산 ({result['mode']}): ROI {result['roi']:+.2f}% / 승률 {result['win_rate']:.1f}% / {len(result['trades'])}회")
@@ -0,0 +1,66 @@
+import os
+import itertools
+from functools import partial
+import settlement
+from shared_arrays import fan_out
+
+# ==========================================
+# 정산 파라미터 그리드 탐색 (프로세스 풀)
+# ==========================================
+# - 같은 구간/판단으로 settlement.simulate만 조합 수만큼 반복 (AI 호출 없음)
+# - [NEW] 종가/ATR/판단 배열은 공유 메모리에 한 번만 올리고 워커는 복사 없이 붙음 (shared_arrays.fan_out)
+#   작업에는 파라미터 조합만 담김
+# - 조합을 여러 개씩 묶어(chunk) 보내서 작업 전달 비용을 줄임
+# - [NEW] 캔들 꼬리 정산(bars)도 공유 메모리로, SL/TP 동시 터치 판정기(resolve)는 워커에서 1m 캐시만 읽음
+
+DECISION_KEYS = ('side', 'confidence', 'sl', 'tp')
+BAR_KEYS = ('open', 'high', 'low', 'ts')
+
+def expand_grid(grid):
+    """{'conf_threshold': [60, 70], 'sl_atr': [1, 2]} -> 파라미터 조합 dict 목록"""
+    unknown = set(grid) - set(settlement.SIM_PARAMS)
+    if unknown:
+        raise ValueError(f"알 수 없는 파라미터: {', '.join(sorted(unknown))}")
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def _score(close, decisions, atr, initial_balance, params, bars=None, resolve=None):
+    sim = settlement.simulate(close, decisions, initial_balance, atr=atr, keep_logs=False,
+                              bars=bars, resolve=resolve, **params)
+    total_trades = sim['total_trades']
+    return {
+        'params': params,
+        'final_balance': sim['balance'],
+        'roi': ((sim['balance'] / initial_balance) - 1) * 100,
+        'win_rate': (sim['wins'] / total_trades * 100) if total_trades > 0 else 0,
+        'total_trades': total_trades
+    }
+
+def _run_chunk(initial_balance, resolve, plane, combos):
+    decisions = {key: plane[key] for key in DECISION_KEYS}
+    bars = {key: plane[f'bar_{key}'] for key in BAR_KEYS} if plane.get('bar_ts') is not None else None
+    return [_score(plane['close'], decisions, plane.get('atr'), initial_balance, params, bars, resolve)
+            for params in combos]
+
+def run_sweep(close, decisions, initial_balance, grid, atr=None, max_workers=None, chunk_size=None,
+              bars=None, resolve=None):
+    """
+    grid의 모든 조합을 정산해서 ROI 내림차순으로 반환
+    max_workers: 기본 = CPU 코어 수, 1이면 현재 프로세스에서 바로 실행
+    bars / resolve: settlement.simulate와 동일 (resolve는 pickle 가능해야 함 - intrabar.IntrabarResolver)
+    """
+    combos = expand_grid(grid)
+    if not combos: return []
+    workers = min(max_workers or os.cpu_count() or 1, len(combos))
+
+    # 워커당 4묶음 정도 -> 느린 묶음이 있어도 코어가 놀지 않음
+    chunk_size = chunk_size or max(1, -(-len(combos) // (workers * 4)))
+    chunks = [combos[i:i + chunk_size] for i in range(0, len(combos), chunk_size)]
+    arrays = {'close': close, 'atr': atr, **{key: decisions[key] for key in DECISION_KEYS}}
+    if bars is not None:
+        arrays.update({f'bar_{key}': bars[key] for key in BAR_KEYS})
+    results = [row for rows in fan_out(partial(_run_chunk, initial_balance, resolve), arrays, chunks, workers)
+               for row in rows]
+
+    results.sort(key=lambda r: (r['roi'], r['win_rate']), reverse=True)
+    return results
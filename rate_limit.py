@@ -0,0 +1,58 @@
+import threading
+import time
+
+# ==========================================
+# 분당 요청 한도 (토큰 버킷)
+# ==========================================
+# - TokenBucket: 키/엔드포인트 1개의 RPM 한도 (KeyManager가 키마다 하나씩 보유)
+# - RateLimiter: 여러 스레드가 함께 쓰는 블로킹 한도 (과거 캔들 다운로드 등)
+
+class TokenBucket:
+    """
+    분당 요청 속도 제한 (RPM 토큰 버킷, 스레드 안전하지 않음 - 호출 측 lock 사용)
+    - 초당 rpm/60개씩 토큰이 채워짐
+    - 429 발생 시 cool_down으로 일정 시간 사용 중지
+    """
+    def __init__(self, rpm):
+        self.capacity = max(1, rpm)
+        self.rate = max(rpm, 1) / 60.0
+        self.tokens = float(self.capacity)
+        self.blocked_until = 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """다음 요청까지 기다려야 할 시간(초)"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def consume(self):
+        self.tokens -= 1
+
+    def cool_down(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def clear_cool_down(self):
+        self.blocked_until = 0.0
+
+class RateLimiter:
+    """[NEW] 여러 스레드가 함께 쓰는 분당 요청 한도 (TokenBucket + Lock). acquire는 토큰이 생길 때까지 대기"""
+    def __init__(self, rpm):
+        self.bucket = TokenBucket(rpm)
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                wait = self.bucket.wait_time()
+                if wait <= 0:
+                    self.bucket.consume()
+                    return
+            time.sleep(wait)
@@ -0,0 +1,263 @@
+import numpy as np
+
+# ==========================================
+# 백테스트 정산 엔진 (NumPy 배열 기반)
+# ==========================================
+# 기존 df.iterrows() 루프와 동일한 규칙:
+# - 포지션 보유 중에는 매 캔들 종가로 SL -> TP 순서로 청산 체크
+# - 청산된 캔들에서도 바로 신규 진입 가능 (진입 캔들에서는 청산 체크 안 함)
+# - 잔고의 99% 진입, 청산 시 수수료 0.04%, SL 누락 시 ±2% 안전망
+# - [NEW] 위 숫자들은 simulate 인자로 바꿔서 재정산 가능 (기본값 = 기존 규칙)
+# - [NEW] sl_atr / tp_atr > 0 이면 AI가 준 SL/TP 대신 진입가 ± ATR x 배수 사용 (0 = AI 값 사용)
+# - [NEW] bars(시가/고가/저가)를 넘기면 종가 대신 캔들 꼬리로 SL/TP 체크, 체결가 = SL/TP 가격 (시가 갭이면 시가)
+#   한 캔들에서 SL/TP 둘 다 닿으면 resolve(하위 캔들 판정)로 먼저 닿은 쪽을 정함 (없으면 SL 우선)
+
+SIDE_CODES = {'long': 1, 'short': -1}
+FEE_RATE = 0.0004
+CONF_THRESHOLD = 70
+SIZE_FRAC = 0.99
+SL_FALLBACK = 0.02
+SL_ATR = 0
+TP_ATR = 0
+SIM_PARAMS = ('conf_threshold', 'fee_rate', 'size_frac', 'sl_fallback', 'sl_atr', 'tp_atr')
+
+def _to_float(value, default=np.nan):
+    if value is None: return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+def empty_decision_arrays(n):
+    """판단이 하나도 없는 상태의 배열 세트 (side 0 = 판단 없음/hold)"""
+    return {
+        'side': np.zeros(n, dtype=np.int8),
+        'confidence': np.zeros(n, dtype=np.float64),
+        'sl': np.full(n, np.nan),
+        'tp': np.full(n, np.nan)
+    }
+
+def fill_decisions(decisions, positions, responses):
+    """캔들 위치(positions)에 AI 응답(responses)을 채워 넣음"""
+    if len(positions) == 0: return
+    # 원소 단위 대입 대신 리스트로 모아 한 번에 채움
+    decisions['side'][positions] = [
+        SIDE_CODES.get(d.lower(), 0) if isinstance(d, str) else 0
+        for d in (res.get('decision', 'hold') for res in responses)
+    ]
+    decisions['confidence'][positions] = [_to_float(res.get('confidence', 0), 0.0) for res in responses]
+    decisions['sl'][positions] = [_to_float(res.get('sl')) for res in responses]
+    decisions['tp'][positions] = [_to_float(res.get('tp')) for res in responses]
+
+def build_decision_arrays(index, ai_results):
+    """
+    {Timestamp: AI 응답} 딕셔너리를 캔들 위치 기준 배열로 변환
+    반환: side(+1/-1/0), confidence, sl, tp 배열 (값 없음 = 0 / NaN)
+    """
+    decisions = empty_decision_arrays(len(index))
+    if ai_results:
+        positions = index.get_indexer(list(ai_results.keys()))
+        valid = positions >= 0
+        responses = [res for res, ok in zip(ai_results.values(), valid) if ok]
+        fill_decisions(decisions, positions[valid], responses)
+    return decisions
+
+def is_entry(decisions, j, conf_threshold=CONF_THRESHOLD):
+    """j번째 캔들 판단이 진입 조건(long/short + 확신도 기준 이상)을 만족하는지"""
+    return decisions['side'][j] != 0 and decisions['confidence'][j] >= conf_threshold
+
+def position_levels(decisions, j, entry_price, sl_fallback=SL_FALLBACK, atr=None, sl_atr=SL_ATR, tp_atr=TP_ATR):
+    """
+    진입 시 사용할 (side, sl, tp). SL 누락 시 ±sl_fallback 안전망, TP 누락 시 NaN
+    atr 배열과 sl_atr/tp_atr 배수가 있으면 진입가 ± ATR x 배수로 대체 (ATR이 NaN인 캔들은 AI 값 유지)
+    """
+    side = int(decisions['side'][j])
+    sl = decisions['sl'][j]
+    tp = decisions['tp'][j]
+    if atr is not None and not np.isnan(atr[j]):
+        if sl_atr > 0: sl = entry_price - side * atr[j] * sl_atr
+        if tp_atr > 0: tp = entry_price + side * atr[j] * tp_atr
+    if not sl or np.isnan(sl):
+        sl = entry_price * (1 - sl_fallback) if side > 0 else entry_price * (1 + sl_fallback)
+    if tp == 0:
+        tp = np.nan
+    return side, sl, tp
+
+def bar_arrays(df):
+    """[NEW] 캔들 꼬리 정산용 배열 {'open', 'high', 'low', 'ts'(캔들 시작 ms)}"""
+    return {
+        'open': df['open'].to_numpy(dtype=np.float64),
+        'high': df['high'].to_numpy(dtype=np.float64),
+        'low': df['low'].to_numpy(dtype=np.float64),
+        'ts': df.index.as_unit('ms').asi8
+    }
+
+def gap_reason(open_price, side, sl, tp):
+    """[NEW] 시가가 이미 SL/TP 너머에서 시작했으면 그쪽 ("SL"/"TP"), 아니면 None"""
+    if side > 0:
+        if open_price <= sl: return "SL"
+        if open_price >= tp: return "TP"
+    else:
+        if open_price >= sl: return "SL"
+        if open_price <= tp: return "TP"
+    return None
+
+def exit_price(close, bars, k, side, sl, tp, reason):
+    """[NEW] 청산 체결가: 종가 정산이면 종가, 꼬리 정산이면 SL/TP 가격 (시가 갭이면 시가)"""
+    if bars is None: return close[k]
+    open_price = bars['open'][k]
+    if gap_reason(open_price, side, sl, tp) == reason: return open_price
+    return sl if reason == "SL" else tp
+
+def find_exit(close, start, side, sl, tp, block=64, bars=None, resolve=None):
+    """
+    start 캔들부터 SL/TP에 처음 닿는 캔들 위치를 찾음 (없으면 None)
+    구간을 점점 키워가며 검사하므로 보유 기간에 비례한 비용만 듦
+    [NEW] bars가 있으면 저가/고가로 체크. SL/TP 둘 다 닿은 캔들은 시가 갭 -> resolve(ts, side, sl, tp) -> SL 순으로 판정
+    """
+    n = len(close)
+    pos = start
+    while pos < n:
+        end = min(n, pos + block)
+        low = close[pos:end] if bars is None else bars['low'][pos:end]
+        high = close[pos:end] if bars is None else bars['high'][pos:end]
+        if side > 0:
+            hit_sl, hit_tp = low <= sl, high >= tp
+        else:
+            hit_sl, hit_tp = high >= sl, low <= tp
+        hit = hit_sl | hit_tp  # tp가 NaN이면 비교 결과가 항상 False
+        if hit.any():
+            k = int(hit.argmax())
+            j = pos + k
+            if hit_sl[k] and hit_tp[k] and bars is not None:
+                reason = gap_reason(bars['open'][j], side, sl, tp)
+                if reason is None and resolve is not None:
+                    reason = resolve(int(bars['ts'][j]), side, sl, tp)
+                return j, reason or "SL"
+            return j, ("SL" if hit_sl[k] else "TP")
+        pos = end
+        block *= 2
+    return None, None
+
+class Settler:
+    """
+    [NEW] 정산 상태(잔고/보유 포지션/통계)를 들고 구간을 창(window) 단위로 이어서 정산
+    - 창 끝까지 청산되지 않은 포지션은 다음 창 첫 캔들부터 SL/TP 체크를 이어감 (한 번에 정산한 것과 동일)
+    - simulate = 창 1개짜리 Settler
+    - [NEW] resolve: 꼬리 정산에서 SL/TP가 한 캔들에 같이 닿았을 때 하위 캔들로 판정하는 함수 (intrabar.IntrabarResolver)
+    """
+    def __init__(self, initial_balance, conf_threshold=CONF_THRESHOLD, fee_rate=FEE_RATE, size_frac=SIZE_FRAC,
+                 sl_fallback=SL_FALLBACK, sl_atr=SL_ATR, tp_atr=TP_ATR, keep_logs=True, logs=None, resolve=None):
+        self.balance = initial_balance
+        self.conf_threshold = conf_threshold
+        self.fee_rate = fee_rate
+        self.size_frac = size_frac
+        self.sl_fallback = sl_fallback
+        self.sl_atr = sl_atr
+        self.tp_atr = tp_atr
+        self.keep_logs = keep_logs
+        self.resolve = resolve
+        self.logs = logs if logs is not None else []  # deque(maxlen)를 넘기면 최근 로그만 유지
+        self.trades = []
+        self.wins = 0
+        self.total_trades = 0
+        self.position = None  # (side, sl, tp, entry_price, amount)
+
+    def flat_index(self, close, bars=None):
+        """이번 창에서 포지션이 없어지는 첫 캔들 위치 (보유 포지션이 창 끝까지 안 닫히면 len(close))"""
+        if self.position is None: return 0
+        side, sl, tp, _, _ = self.position
+        exit_idx, _ = find_exit(close, 0, side, sl, tp, bars=bars)
+        return len(close) if exit_idx is None else exit_idx
+
+    def _exit(self, close, times, exit_idx, reason, bars=None):
+        side, sl, tp, entry_price, amount = self.position
+        self.position = None
+        curr_price = exit_price(close, bars, exit_idx, side, sl, tp, reason)
+        pnl_money = (curr_price - entry_price) * amount if side > 0 else (entry_price - curr_price) * amount
+        fee = curr_price * amount * self.fee_rate
+        net_pnl = pnl_money - fee
+        self.balance += net_pnl + (amount * entry_price)
+
+        roi_trade = (net_pnl / (amount * entry_price)) * 100
+        self.trades.append({'time': times[exit_idx], 'roi': roi_trade, 'pnl': net_pnl, 'reason': reason})
+        if self.keep_logs:
+            side_name = 'long' if side > 0 else 'short'
+            self.logs.append(f"[{times[exit_idx]}] ⚡ {side_name.upper()} 청산 ({reason}): {roi_trade:.2f}%")
+
+        if net_pnl > 0: self.wins += 1
+        self.total_trades += 1
+
+    def feed(self, close, decisions, times=None, atr=None, bars=None):
+        """
+        다음 창 정산. close: 종가 배열, decisions: 같은 길이의 판단 배열 (창 안에서의 정수 위치 기준)
+        atr: ATR 배열 (sl_atr/tp_atr 배수 사용 시), bars: bar_arrays 결과 (캔들 꼬리로 SL/TP 체크, None = 종가)
+        """
+        close = np.ascontiguousarray(close, dtype=np.float64)
+        if times is None:
+            times = np.arange(len(close))
+        cursor = 0  # 포지션이 없는 첫 캔들
+
+        # 0. 이전 창에서 넘어온 포지션
+        if self.position is not None:
+            side, sl, tp, _, _ = self.position
+            exit_idx, reason = find_exit(close, 0, side, sl, tp, bars=bars, resolve=self.resolve)
+            if exit_idx is None: return self
+            self._exit(close, times, exit_idx, reason, bars)
+            cursor = exit_idx
+
+        conf_arr = decisions['confidence']
+        entries = np.flatnonzero((decisions['side'] != 0) & (conf_arr >= self.conf_threshold))
+
+        while True:
+            k = np.searchsorted(entries, cursor)
+            if k >= len(entries): break
+            j = int(entries[k])
+
+            entry_price = close[j]
+            side, sl, tp = position_levels(decisions, j, entry_price, self.sl_fallback, atr, self.sl_atr, self.tp_atr)
+
+            # [백테스트 자금관리] 기본 99% 풀매수
+            invest = self.balance * self.size_frac
+            amount = invest / entry_price
+            self.balance -= invest
+            self.position = (side, sl, tp, entry_price, amount)
+
+            if self.keep_logs:
+                side_name = 'long' if side > 0 else 'short'
+                self.logs.append(f"[{times[j]}] 🚀 {side_name.upper()} 진입 (Conf: {conf_arr[j]:g}%)")
+
+            exit_idx, reason = find_exit(close, j + 1, side, sl, tp, bars=bars, resolve=self.resolve)
+            if exit_idx is None: break  # 창 끝까지 미청산 -> 다음 창으로 (마지막 창이면 기존과 동일하게 잔고에 미반영)
+
+            self._exit(close, times, exit_idx, reason, bars)
+            cursor = exit_idx
+        return self
+
+    def pop_trades(self):
+        """지금까지 쌓인 체결 목록을 넘기고 비움 (창마다 DB로 흘려보낼 때)"""
+        trades, self.trades = self.trades, []
+        return trades
+
+    def result(self):
+        return {
+            'balance': self.balance,
+            'trades': self.trades,
+            'logs': list(self.logs),
+            'wins': self.wins,
+            'total_trades': self.total_trades
+        }
+
+def simulate(close, decisions, initial_balance, times=None, conf_threshold=CONF_THRESHOLD, fee_rate=FEE_RATE,
+             size_frac=SIZE_FRAC, sl_fallback=SL_FALLBACK, atr=None, sl_atr=SL_ATR, tp_atr=TP_ATR, keep_logs=True,
+             bars=None, resolve=None):
+    """
+    close: 종가 배열, decisions: build_decision_arrays 결과
+    conf_threshold: 진입 확신도 기준, fee_rate: 청산 수수료율, size_frac: 진입 비중, sl_fallback: SL 누락 시 안전망 비율
+    atr: ATR 배열 (sl_atr/tp_atr 배수 사용 시), keep_logs: False면 로그 문자열 생략 (파라미터 탐색용)
+    bars: bar_arrays 결과 (캔들 꼬리 정산), resolve: SL/TP 동시 터치 캔들 판정 함수
+    반환: {'balance', 'trades', 'logs', 'wins', 'total_trades'}
+    """
+    settler = Settler(initial_balance, conf_threshold, fee_rate, size_frac, sl_fallback, sl_atr, tp_atr, keep_logs,
+                      resolve=resolve)
+    return settler.feed(close, decisions, times, atr, bars).result()
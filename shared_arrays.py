@@ -0,0 +1,102 @@
+import os
+import numpy as np
+from functools import partial
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+# ==========================================
+# 프로세스 간 공유 배열 (multiprocessing.shared_memory)
+# ==========================================
+# - 부모 프로세스가 numpy 배열들을 공유 메모리 블록 하나에 한 번만 올림 (publish)
+# - 워커 프로세스는 작은 descriptor(블록 이름 + 배열 배치 정보)만 받아서 복사 없이 붙음 (attach)
+# - 워커 쪽 배열은 읽기 전용, 블록 해제(unlink)는 만든 쪽(owner)만 함
+# - fan_out: 배열을 한 번 올리고 func(plane, task)를 프로세스 풀로 병렬 실행 (작업에는 task만 담김)
+
+ALIGN = 64  # 배열 시작 위치 정렬 (캐시 라인)
+
+class SharedArrays:
+    def __init__(self, shm, layout, owner):
+        self.shm = shm
+        self.layout = layout  # {key: (dtype 문자열, shape, offset)}
+        self.owner = owner
+        self.arrays = {
+            key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for key, (dtype, shape, offset) in layout.items()
+        }
+
+    @classmethod
+    def publish(cls, arrays):
+        """{이름: 배열}을 새 공유 메모리 블록에 복사해서 올림 (None 값은 건너뜀)"""
+        arrays = {key: np.ascontiguousarray(arr) for key, arr in arrays.items() if arr is not None}
+        layout = {}
+        size = 0
+        for key, arr in arrays.items():
+            size = -(-size // ALIGN) * ALIGN
+            layout[key] = (arr.dtype.str, arr.shape, size)
+            size += arr.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        plane = cls(shm, layout, owner=True)
+        for key, arr in arrays.items():
+            plane.arrays[key][...] = arr
+        return plane
+
+    @classmethod
+    def attach(cls, descriptor):
+        """publish 쪽 descriptor로 같은 블록에 붙음 (복사 없음, 읽기 전용)"""
+        plane = cls(shared_memory.SharedMemory(name=descriptor['name']), descriptor['layout'], owner=False)
+        for arr in plane.arrays.values():
+            arr.flags.writeable = False
+        return plane
+
+    @property
+    def descriptor(self):
+        """워커에 넘길 정보 (pickle 크기 = 배열 개수에만 비례)"""
+        return {'name': self.shm.name, 'layout': self.layout}
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def get(self, key, default=None):
+        return self.arrays.get(key, default)
+
+    def close(self):
+        """배열 참조를 놓고 블록을 닫음 (owner면 블록 삭제까지)"""
+        self.arrays = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_attached = None  # 워커 프로세스가 붙어 있는 SharedArrays (프로세스 종료 시 함께 해제)
+
+def _attach_worker(descriptor):
+    global _attached
+    _attached = SharedArrays.attach(descriptor)
+
+def _call_attached(func, task):
+    return func(_attached, task)
+
+def fan_out(func, arrays, tasks, max_workers=None):
+    """
+    arrays를 공유 메모리에 한 번 올리고 func(plane, task)를 프로세스 풀로 실행 -> tasks 순서대로 결과 목록
+    - func는 모듈 최상위 함수(또는 그 partial)여야 함 (워커로 pickle 전달)
+    - 결과에 plane 배열의 view를 담으면 안 됨 (블록이 닫힘) -> 값/복사본으로 반환
+    - max_workers: 기본 = CPU 코어 수, 1 이하면 현재 프로세스에서 같은 plane으로 실행
+    """
+    tasks = list(tasks)
+    workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    with SharedArrays.publish(arrays) as plane:
+        if workers <= 1:
+            return [func(plane, task) for task in tasks]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker,
+                                 initargs=(plane.descriptor,)) as pool:
+            return list(pool.map(partial(_call_attached, func), tasks))